@@ -13,17 +13,19 @@ from carthage.config import ConfigSchema
 from carthage.config.types import ConfigString
 __all__ = []
 
-from .connection import AwsConnection, AwsTagProvider, carthage_aws_layout_adopt_resources
-__all__ += ['AwsConnection', 'AwsTagProvider', 'carthage_aws_layout_adopt_resources']
+from .connection import AwsConnection, AwsTagProvider, carthage_aws_layout_adopt_resources, bulk_destroy, delete_orphans
+__all__ += ['AwsConnection', 'AwsTagProvider', 'carthage_aws_layout_adopt_resources', 'bulk_destroy', 'delete_orphans']
 
 from .network import (
     AwsVirtualPrivateCloud, AwsSubnet, SgRule, AwsSecurityGroup, VpcAddress,
-    network_for_existing_vm, AwsRouteTable, AwsInternetGateway, AwsNatGateway
+    network_for_existing_vm, AwsRouteTable, AwsInternetGateway, AwsNatGateway,
+    provision_nat_gateways, destroy_nat_gateways, AwsManagedPrefixList,
 )
 __all__ += ['AwsVirtualPrivateCloud', 'AwsSubnet',
             'AwsSecurityGroup', 'SgRule',
             'VpcAddress', 'network_for_existing_vm',
-            'AwsRouteTable', 'AwsInternetGateway', 'AwsNatGateway']
+            'AwsRouteTable', 'AwsInternetGateway', 'AwsNatGateway',
+            'provision_nat_gateways', 'destroy_nat_gateways', 'AwsManagedPrefixList']
 
 from .dns import AwsHostedZone, AwsPrivateHostedZone, AwsDnsManagement
 __all__ += ['AwsHostedZone', 'AwsPrivateHostedZone', 'AwsDnsManagement']
@@ -31,12 +33,21 @@ __all__ += ['AwsHostedZone', 'AwsPrivateHostedZone', 'AwsDnsManagement']
 from .vm import AwsVm, MaybeLocalAwsVm
 __all__ += ['AwsVm', 'MaybeLocalAwsVm']
 
+from .launch_template import AwsLaunchTemplate
+__all__ += ['AwsLaunchTemplate']
+
+from .placement import AwsPlacementGroup, AwsCapacityReservation
+__all__ += ['AwsPlacementGroup', 'AwsCapacityReservation']
+
+from .autoscaling import AwsAutoScalingGroup
+__all__ += ['AwsAutoScalingGroup']
+
 from .image import (
-    AwsImage, image_provider, debian_ami_owner, ImageBuilderVolume,
-    AttachImageBuilderVolume, build_ami
+    AwsImage, image_provider, find_images, clear_image_cache, debian_ami_owner,
+    ImageBuilderVolume, AttachImageBuilderVolume, build_ami
 )
 __all__ += [
-    'AwsImage', 'image_provider', 'debian_ami_owner', 'AttachImageBuilderVolume', 
+    'AwsImage', 'image_provider', 'find_images', 'clear_image_cache', 'debian_ami_owner', 'AttachImageBuilderVolume', 
     'ImageBuilderVolume', 'build_ami'
 ]
 
@@ -69,6 +80,25 @@ class AwsConfig(ConfigSchema, prefix = "aws"):
     # https://docs.aws.amazon.com/vpc/latest/userguide/vpc-dns.html#vpc-dns-support
     vpc_dns_hostnames_enabled: bool = False
 
+    #: Number of unassociated elastic IPs to keep allocated so that
+    #addresses can be assigned without waiting for an allocation.
+    eip_reserve: int = 0
+
+    #: Seconds for which image_provider lookups are cached in memory
+    #and under cache_dir; 0, the default, disables caching.
+    image_cache_ttl: int = 0
+
+    #: Client connect and read timeouts in seconds.  Creates carry
+    #idempotency tokens, so timed out requests are safely retried.
+    connect_timeout: int = 10
+    read_timeout: int = 30
+    #: Total attempts per request, including retries
+    max_attempts: int = 5
+
+    #: Log a warning with a stack trace and duration for any AWS
+    #request made on the event loop thread.
+    debug_blocking_calls: bool = False
+
 
 @inject(injector=Injector)
 def enable_new_aws_connection(injector):
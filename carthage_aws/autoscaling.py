@@ -0,0 +1,225 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+import asyncio
+import functools
+
+from carthage import *
+from carthage.modeling import *
+from carthage.dependency_injection import *
+
+from .connection import AwsManaged, run_in_executor
+from .instance_options import validate_network_options
+from .launch_template import launch_template_for
+from .network import AwsSubnet
+from .vm import AwsVm
+
+__all__ = []
+
+class AwsAutoScalingGroup(AwsManaged, InjectableModel):
+
+    '''
+    An EC2 Auto Scaling group running a pool of identical instances
+    from a launch template generated from a machine model.
+
+    Exactly one :class:`~carthage.modeling.MachineModel` is nested in
+    the group.  It serves as the template and is never created
+    itself.  Each of its network links names a subnet the group may
+    launch into, so links in several availability zones spread the
+    pool across them.  The links must share security groups and may
+    not have fixed addresses.
+
+    Changing *min_size*, *max_size* or *desired_capacity* is one
+    ``update_auto_scaling_group`` call; Auto Scaling launches and
+    terminates the instances.  A changed model produces a new launch
+    template, which applies to instances launched afterward.
+
+    Tags from the :class:`~.connection.AwsTagProvider` objects are
+    applied to the group and propagated to its instances, which are
+    not treated as orphans.
+
+    :param desired_capacity: If None, the capacity is left to scaling policies.
+    '''
+
+    stamp_type = 'auto_scaling_group'
+    resource_type = 'auto_scaling_group'
+    resource_factory_method = NotImplemented
+
+    min_size: int = 0
+    max_size: int = 1
+    desired_capacity: int = None
+    health_check_grace_period: int = None
+
+    #: Seconds between checks that a deleted group is gone
+    delete_poll_interval = 10
+
+    def __init__(self, **kwargs):
+        for k in ('min_size', 'max_size', 'desired_capacity', 'health_check_grace_period'):
+            if k in kwargs:
+                setattr(self, k, kwargs.pop(k))
+        super().__init__(**kwargs)
+        self.launch_template = None
+        self.subnet_ids = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.name:
+            provides(InjectionKey(AwsAutoScalingGroup, name=cls.name))(cls)
+
+    @memoproperty
+    def service_resource(self):
+        return self.connection.connection.client(
+            'autoscaling', region_name=self.connection.region, config=self.connection.client_config())
+
+    @property
+    def client(self):
+        return self.service_resource
+
+    async def template_machine(self):
+        '''The :class:`~.vm.AwsVm` of the nested machine model, with networking resolved.'''
+        keys = self.injector.filter(MachineModel, ['host'], stop_at=self.injector)
+        if len(keys) != 1:
+            raise ValueError(f'{self} must contain exactly one MachineModel, not {len(keys)}')
+        model = await self.ainjector.get_instance_async(
+            InjectionKey(MachineModel, **keys[0].constraints, _ready=False))
+        machine = model.machine
+        if not isinstance(machine, AwsVm):
+            raise TypeError(f'{self} requires an AwsVm template, not {machine!r}')
+        await machine.resolve_networking()
+        return machine
+
+    async def resolve_template(self):
+        '''
+        Resolve the template machine's launch configuration and find
+        or create the launch template for the group.
+
+        :raises ValueError: if the template machine's links cannot be used by the group.
+        '''
+        machine = await self.template_machine()
+        links = [l for l in machine.network_links.values() if not l.local_type]
+        if not links:
+            raise ValueError(f'{self} requires a network link to launch into')
+        await asyncio.gather(*(l.instantiate(AwsSubnet) for l in links))
+        await machine.start_dependencies()
+        await machine.resolve_launch_configuration()
+        for l in links:
+            if l.merged_v4_config.address or l.merged_v4_config.public_address:
+                raise ValueError(f'{self}: {l.interface} has a fixed address')
+            if sorted(l.security_group_ids) != sorted(links[0].security_group_ids):
+                raise ValueError(f'{self}: all links must have the same security groups')
+        # The links are alternative subnets for a single interface
+        validate_network_options(machine.instance_type_info, links[:1])
+        interface = machine.network_interfaces()[0]
+        del interface['SubnetId']
+        interface.pop('Description', None)
+        data = machine.launch_template_data()
+        data['NetworkInterfaces'] = [interface]
+        if user_data := machine.encoded_user_data():
+            data['UserData'] = user_data
+        if machine.capacity_reservations:
+            data['CapacityReservationSpecification'] = machine.capacity_reservations[0]
+        self.subnet_ids = [l.net_instance.id for l in links]
+        self.launch_template = await launch_template_for(machine.ainjector, data)
+
+    def group_parameters(self):
+        '''The parameters for creating or updating the group.'''
+        parameters = {
+            'LaunchTemplate': self.launch_template.specification(),
+            'MinSize': self.min_size,
+            'MaxSize': self.max_size,
+            'VPCZoneIdentifier': ','.join(self.subnet_ids),
+        }
+        if self.desired_capacity is not None:
+            parameters['DesiredCapacity'] = self.desired_capacity
+        if self.health_check_grace_period is not None:
+            parameters['HealthCheckGracePeriod'] = self.health_check_grace_period
+        return parameters
+
+    def group_tags(self):
+        ''':meth:`expected_resource_tags` in the form Auto Scaling expects, propagated to instances.'''
+        return [{
+            'Key': k,
+            'Value': v,
+            'PropagateAtLaunch': True,
+            'ResourceId': self.name,
+            'ResourceType': 'auto-scaling-group',
+        } for k, v in self.expected_resource_tags().items()]
+
+    async def possible_ids_for_name(self):
+        # Groups are identified by name
+        return [self.name]
+
+    def find_from_id(self):
+        r = self.client.describe_auto_scaling_groups(AutoScalingGroupNames=[self.id])
+        groups = [g for g in r['AutoScalingGroups'] if g.get('Status') != 'Delete in progress']
+        self.mob = groups[0] if groups else None
+        return self.mob
+
+    def current_resource_tags(self):
+        if self.mob is None:
+            return None
+        return {t['Key']: t['Value'] for t in self.mob.get('Tags', [])}
+
+    async def retag(self):
+        await run_in_executor(functools.partial(self.client.create_or_update_tags, Tags=self.group_tags()))
+
+    def owned_resource_ids(self):
+        if not self.mob:
+            return []
+        results = [i['InstanceId'] for i in self.mob['Instances']]
+        if template_id := self.mob.get('LaunchTemplate', {}).get('LaunchTemplateId'):
+            results.append(template_id)
+        return results
+
+    async def dynamic_dependencies(self):
+        machine = await self.template_machine()
+        return await machine.dynamic_dependencies()
+
+    async def pre_create_hook(self):
+        await self.resolve_template()
+
+    def do_create(self):
+        self.client.create_auto_scaling_group(
+            AutoScalingGroupName=self.name,
+            Tags=self.group_tags(),
+            **self.group_parameters())
+        self.id = self.name
+
+    async def read_write_hook(self):
+        if self.launch_template is None:
+            await self.resolve_template()
+        current = {
+            'LaunchTemplate': {k: self.mob.get('LaunchTemplate', {}).get(k) for k in ('LaunchTemplateId', 'Version')},
+            'MinSize': self.mob['MinSize'],
+            'MaxSize': self.mob['MaxSize'],
+            'DesiredCapacity': self.mob['DesiredCapacity'],
+            'HealthCheckGracePeriod': self.mob.get('HealthCheckGracePeriod'),
+        }
+        changes = {k: v for k, v in self.group_parameters().items() if current.get(k) != v}
+        if set(self.mob['VPCZoneIdentifier'].split(',')) == set(self.subnet_ids):
+            changes.pop('VPCZoneIdentifier', None)
+        if not changes:
+            return
+        logger.info('Updating %s: %s', self, ', '.join(changes))
+        await run_in_executor(functools.partial(
+            self.client.update_auto_scaling_group, AutoScalingGroupName=self.name, **changes))
+        await run_in_executor(self.find_from_id)
+
+    async def delete(self):
+        # ForceDelete terminates the instances; wait for them so that
+        # the group's subnets and security groups can be deleted.
+        await run_in_executor(functools.partial(
+            self.client.delete_auto_scaling_group, AutoScalingGroupName=self.name, ForceDelete=True))
+        def exists():
+            r = self.client.describe_auto_scaling_groups(AutoScalingGroupNames=[self.name])
+            return bool(r['AutoScalingGroups'])
+        while await run_in_executor(exists):
+            await asyncio.sleep(self.delete_poll_interval)
+        self.mob = None
+
+__all__ += ['AwsAutoScalingGroup']
@@ -5,17 +5,26 @@
 # WITHOUT ANY WARRANTY; without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
 # LICENSE for details.
+# pylint: disable=too-many-lines
 
 from pathlib import Path
 import asyncio
+import hashlib
+import json
+import secrets
+import threading
+import time
+import traceback
 import typing
 
 import carthage.network
 from carthage import *
 from carthage.config import ConfigLayout
 from carthage.dependency_injection import *
+from carthage.deployment import clear_dry_run_marker, orphan_policy
 from carthage.modeling import propagate_key, CarthageLayout
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError, WaiterError
 
 #: Mapping of resource_types to classes that implement them
@@ -27,6 +36,105 @@ __all__ = ['AwsConnection', 'AwsManaged']
 async def run_in_executor(func, *args):
     return await asyncio.get_event_loop().run_in_executor(None, func, *args)
 
+def _note_loop_call(context, **kwargs): # pylint: disable=unused-argument
+    # botocore before-call handler registered when aws.debug_blocking_calls is set
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return # Not on an event loop thread
+    frames = [f for f in traceback.extract_stack()[:-1]
+              if '/botocore/' not in f.filename and '/boto3/' not in f.filename]
+    context['carthage_loop_call'] = (time.monotonic(), ''.join(traceback.format_list(frames)))
+
+def _report_loop_call(context, model, **kwargs): # pylint: disable=unused-argument
+    # botocore after-call handler; see _note_loop_call
+    if loop_call := context.pop('carthage_loop_call', None):
+        started, stack = loop_call
+        logger.warning(
+            '%s called on the event loop thread; blocked it for %.3f seconds:\n%s',
+            model.name, time.monotonic()-started, stack)
+
+def create_with_client_token(create, token, stale, **parameters):
+    '''
+    Call *create* with *parameters* and the idempotency token
+    (``ClientToken``) *token*.  Because the token is deterministic,
+    botocore may retry a timed-out create without risking a duplicate
+    resource.
+
+    EC2 remembers tokens after the resource they created is deleted
+    and returns that resource again.  If *stale* returns true for the
+    response, the create is repeated once with a fresh random token,
+    which botocore's retries of that call still share.  Run in
+    executor context.
+    '''
+    r = create(ClientToken=token, **parameters)
+    if not stale(r):
+        return r
+    logger.debug('Client token returned a deleted resource; using a fresh token')
+    return create(ClientToken=secrets.token_hex(32), **parameters)
+
+__all__ += ['create_with_client_token']
+
+class AwsBatcher:
+
+    '''
+    Coalesce requests that arrive at about the same time into a single call.
+
+    Many :class:`AwsManaged` objects are typically deployed
+    concurrently, and they tend to reach the same phase (polling for
+    state, starting, stopping) together.  Rather than each object
+    making its own API call, each calls :meth:`request` with a
+    hashable key (typically a resource id).  After *delay* seconds,
+    or once *max_batch* distinct keys are pending, *callback* is
+    called in executor context with the list of pending keys.  It
+    returns a dict mapping keys to results; keys missing from the
+    dict receive ``None``.  If *callback* raises, every request in
+    the batch receives the exception.
+
+    Typically obtained through :meth:`AwsConnection.batcher` so that
+    batches are shared across all objects using a connection.
+
+    '''
+
+    def __init__(self, callback, *, delay=0.1, max_batch=200):
+        self.callback = callback
+        self.delay = delay
+        self.max_batch = max_batch
+        self._pending: dict[typing.Hashable, list[asyncio.Future]] = {}
+        self._handle = None
+
+    async def request(self, key):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._handle is None:
+            self._handle = loop.call_later(self.delay, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            asyncio.ensure_future(self._run(pending))
+
+    async def _run(self, pending):
+        try:
+            results = await run_in_executor(self.callback, list(pending.keys()))
+        except Exception as e:
+            for futures in pending.values():
+                for f in futures:
+                    if not f.done():
+                        f.set_exception(e)
+            return
+        for key, futures in pending.items():
+            for f in futures:
+                if not f.done():
+                    f.set_result(results.get(key))
+
 @inject_autokwargs(config_layout=ConfigLayout)
 class AwsConnection(AsyncInjectable):
 
@@ -41,6 +149,73 @@ class AwsConnection(AsyncInjectable):
         self.igs = []
         self.subnets = []
         self.names_by_resource_type = {}
+        #: Elastic IPs in the account, keyed by public address
+        self.addresses = {}
+        self._address_lock = threading.Lock()
+        self._claiming_addresses = set()
+        self._replenish_task = None
+        self._batchers = {}
+        #: NetworkLink address events queued by :class:`~.vm.AwsVm` for emission in one loop callback
+        self.pending_link_events = []
+        #: describe_images entries keyed by image id; see :meth:`image_metadata`
+        self.images = {}
+        #: describe_instance_types entries keyed by instance type; see :meth:`instance_type_info`
+        self.instance_types = {}
+        #: Network models generated by :func:`~.network.network_for_existing_vm`, shared per subnet
+        self.existing_vm_networks = {}
+        #: Rendered and encoded user data keyed by content hash, shared by the VMs in a layout
+        self.user_data_documents = {}
+        #: Futures for :class:`~.vm.AwsLaunchTemplate` objects keyed by template name
+        self.launch_templates = {}
+        self._recently_created = {}
+        #: time.monotonic() of the latest create by :meth:`AwsManaged.find_or_create` keyed by (resource type, name)
+        self.created_names = {}
+        #: Futures for :class:`~.network.SubnetAddressIndex` objects keyed by subnet id
+        self.address_indexes = {}
+
+    #: Seconds after a create during which describe calls may not yet see the new resource
+    consistency_window = 120
+
+    def remember_created(self, resource_id, data):
+        '''Record the create response *data* for *resource_id*; see :meth:`recently_created_data`.'''
+        now = time.monotonic()
+        # Called from executor threads; iterate over a copy
+        for k, (created, _) in list(self._recently_created.items()):
+            if now-created > self.consistency_window:
+                self._recently_created.pop(k, None)
+        self._recently_created[resource_id] = (now, data)
+
+    def forget_created(self, resource_id):
+        '''Discard the create response for *resource_id*, which is being deleted.'''
+        self._recently_created.pop(resource_id, None)
+
+    def recently_created_data(self, resource_id):
+        '''
+        Return the create response for *resource_id* if it was created
+        by this connection within :attr:`consistency_window` seconds,
+        else None.  Used when a describe fails because EC2 has not yet
+        caught up with our own write.
+        '''
+        try:
+            created, data = self._recently_created[resource_id]
+        except KeyError:
+            return None
+        if time.monotonic()-created > self.consistency_window:
+            del self._recently_created[resource_id]
+            return None
+        return data
+
+    def batcher(self, key, callback, **kwargs):
+        '''Return the :class:`AwsBatcher` registered under *key*,
+        creating it with *callback* if needed.  All objects using
+        this connection share the batcher, so their requests
+        coalesce.
+        '''
+        try:
+            return self._batchers[key]
+        except KeyError:
+            self._batchers[key] = AwsBatcher(callback, **kwargs)
+            return self._batchers[key]
 
 
     async def _tag_filter(self, strict):
@@ -66,19 +241,38 @@ class AwsConnection(AsyncInjectable):
                 })
         return result
 
-    async def inventory(self):
+    def client_config(self):
+        '''
+        Timeouts and retries for clients.  Creates use idempotency
+        tokens (see :func:`create_with_client_token`), so timeouts can
+        be short and retried immediately.
+        '''
+        return Config(
+            connect_timeout=self.config.connect_timeout,
+            read_timeout=self.config.read_timeout,
+            retries={'mode': 'standard', 'max_attempts': self.config.max_attempts},
+        )
+
+    def _connect(self):
+        # Executor context; loading credentials and service models reads files
         self.connection = boto3.Session(
             aws_access_key_id=self.config.access_key_id,
             aws_secret_access_key=self.config.secret_access_key,
             profile_name=self.config.profile if self.config.profile else None
         )
+        if self.config.debug_blocking_calls:
+            self.connection.events.register('before-call', _note_loop_call)
+            self.connection.events.register('after-call', _report_loop_call)
         self.region = self.config.region
-        self.client = self.connection.client('ec2', region_name=self.region)
+        self.client = self.connection.client('ec2', region_name=self.region, config=self.client_config())
         try:
             for key in self.client.describe_key_pairs()['KeyPairs']:
                 self.keys.append(key['KeyName'])
         except ClientError:
             pass #assume authorization error.
+
+    async def inventory(self):
+        await run_in_executor(self._connect)
         tag_filter = await self._tag_filter(False)
         self.names_by_resource_type = await run_in_executor(self._inventory, tag_filter)
 
@@ -132,13 +326,214 @@ class AwsConnection(AsyncInjectable):
         for s in r['Subnets']:
             subnet = {'CidrBlock': s['CidrBlock'], 'id': s['SubnetId'], 'vpc': s['VpcId']}
             self.subnets.append(subnet)
+
+        r = self.client.describe_addresses()
+        with self._address_lock:
+            self.addresses = {a['PublicIp']: a for a in r['Addresses']}
         return nbrt
 
 
+    async def subnet_info(self, subnet_id):
+        '''
+        Return the inventory entry (a dict with *CidrBlock*, *id*
+        and *vpc*) for *subnet_id*.  Subnets created since inventory
+        are looked up with a describe call shared among concurrent
+        lookups and then added to :attr:`subnets`.
+
+        :raises LookupError: if the subnet does not exist.
+        '''
+        for s in self.subnets:
+            if s['id'] == subnet_id:
+                return s
+
+        def describe_subnets(ids):
+            r = self.client.describe_subnets(Filters=[{'Name': 'subnet-id', 'Values': ids}])
+            return {s['SubnetId']: s for s in r['Subnets']}
+
+        batcher = self.batcher('describe_subnets', describe_subnets)
+        s = await batcher.request(subnet_id)
+        if s is None:
+            raise LookupError(f'Subnet {subnet_id} not found')
+        subnet = {'CidrBlock': s['CidrBlock'], 'id': s['SubnetId'], 'vpc': s['VpcId']}
+        self.subnets.append(subnet)
+        return subnet
+
+    async def image_metadata(self, image_id):
+        '''
+        Return the ``describe_images`` entry for *image_id*.  AMIs are
+        immutable, so entries are cached until :meth:`forget_image`
+        (called on deregistration).  Concurrent lookups share one
+        describe call.
+
+        :raises LookupError: if the image does not exist.
+        '''
+        try:
+            return self.images[image_id]
+        except KeyError:
+            pass
+
+        def describe_images(ids):
+            try:
+                r = self.client.describe_images(ImageIds=ids)
+                images = r['Images']
+            except ClientError:
+                # One bad id fails the request; retry individually
+                if len(ids) == 1:
+                    return {}
+                images = []
+                for i in ids:
+                    images.extend(describe_images([i]).values())
+            return {i['ImageId']: i for i in images}
+
+        batcher = self.batcher('describe_images', describe_images)
+        result = await batcher.request(image_id)
+        if result is None:
+            raise LookupError(f'Image {image_id} not found')
+        self.images[image_id] = result
+        return result
+
+    async def instance_type_info(self, instance_type):
+        '''
+        Return the ``describe_instance_types`` entry for
+        *instance_type*, describing its network, CPU, EBS and
+        burstable capabilities.  The catalog does not change during a
+        run, so entries are cached for the life of the connection.
+
+        :raises LookupError: if the instance type is not offered in the region.
+        '''
+        try:
+            return self.instance_types[instance_type]
+        except KeyError:
+            pass
+
+        def describe_instance_types(names):
+            try:
+                r = self.client.describe_instance_types(InstanceTypes=names)
+                entries = r['InstanceTypes']
+            except ClientError:
+                # One bad type fails the request; retry individually
+                if len(names) == 1:
+                    return {}
+                entries = []
+                for t in names:
+                    entries.extend(describe_instance_types([t]).values())
+            return {t['InstanceType']: t for t in entries}
+
+        batcher = self.batcher('describe_instance_types', describe_instance_types)
+        result = await batcher.request(instance_type)
+        if result is None:
+            raise LookupError(f'Instance type {instance_type} not offered in {self.region}')
+        self.instance_types[instance_type] = result
+        return result
+
+    def remember_images(self, images):
+        '''Add ``describe_images`` entries obtained elsewhere to the image cache.'''
+        for i in images:
+            self.images[i['ImageId']] = i
+
+    def forget_image(self, image_id):
+        self.images.pop(image_id, None)
+
     async def async_ready(self):
         await self.inventory()
+        await self.replenish_address_reserve()
         return await super().async_ready()
 
+    #: Tag marking elastic IPs that belong to the reserve.  Reserved
+    #addresses have no Name tag so they are neither adopted by name
+    #nor considered orphans.
+    address_reserve_tag = 'carthage:eip_reserve'
+
+    def _is_reserved_address(self, address):
+        if 'AssociationId' in address or address.get('AllocationId') in self._claiming_addresses:
+            return False
+        return any(t['Key'] == self.address_reserve_tag for t in address.get('Tags', []))
+
+    def reserved_addresses(self):
+        '''Unassociated addresses in the reserve; see :meth:`replenish_address_reserve`.
+        '''
+        with self._address_lock:
+            return [a for a in self.addresses.values() if self._is_reserved_address(a)]
+
+    def claim_reserved_address(self, tags):
+        '''
+        Claim an address from the reserve, replacing its reserve tag with *tags*.
+        Run in executor context.
+
+        :returns: The address description or *None* if the reserve is empty.
+        '''
+        with self._address_lock:
+            for address in self.addresses.values():
+                if self._is_reserved_address(address):
+                    break
+            else:
+                return None
+            # Keep concurrent claims off this address until the tags change
+            self._claiming_addresses.add(address['AllocationId'])
+        untagged = False
+        try:
+            self.client.delete_tags(
+                Resources=[address['AllocationId']],
+                Tags=[{'Key': self.address_reserve_tag}])
+            untagged = True
+            self.client.create_tags(Resources=[address['AllocationId']], Tags=tags)
+            with self._address_lock:
+                address['Tags'] = list(tags)
+        except Exception:
+            if untagged:
+                with self._address_lock:
+                    address['Tags'] = [t for t in address.get('Tags', []) if t['Key'] != self.address_reserve_tag]
+            raise
+        finally:
+            with self._address_lock:
+                self._claiming_addresses.discard(address['AllocationId'])
+        return address
+
+    def remember_address(self, address):
+        '''Record an address description (as returned by ``describe_addresses``) in :attr:`addresses`.
+        '''
+        with self._address_lock:
+            self.addresses[address['PublicIp']] = address
+
+    def forget_address(self, public_ip):
+        with self._address_lock:
+            self.addresses.pop(public_ip, None)
+
+    async def replenish_address_reserve(self):
+        '''
+        Allocate elastic IPs until the reserve contains
+        ``aws.eip_reserve`` unassociated addresses.  Reserved addresses
+        are claimed by :class:`~.network.VpcAddress` instead of
+        allocating a new address.
+        '''
+        needed = (self.config.eip_reserve or 0) - len(self.reserved_addresses())
+        if needed <= 0:
+            return
+
+        def allocate():
+            tags = [{'Key': self.address_reserve_tag, 'Value': 'available'}]
+            r = self.client.allocate_address(
+                Domain='vpc',
+                TagSpecifications=[{'ResourceType': 'elastic-ip', 'Tags': tags}])
+            self.remember_address({
+                'PublicIp': r['PublicIp'],
+                'AllocationId': r['AllocationId'],
+                'Domain': r['Domain'],
+                'Tags': tags})
+
+        logger.info('Allocating %d addresses for the elastic IP reserve', needed)
+        await asyncio.gather(*(run_in_executor(allocate) for _ in range(needed)))
+
+    def schedule_address_reserve_replenish(self):
+        '''Replenish the address reserve in the background unless already doing so.'''
+        if self._replenish_task and not self._replenish_task.done():
+            return
+        def done(task):
+            if not task.cancelled() and task.exception():
+                logger.error('Failed to replenish elastic IP reserve: %s', task.exception())
+        self._replenish_task = asyncio.ensure_future(self.replenish_address_reserve())
+        self._replenish_task.add_done_callback(done)
+
     def invalid_ec2_resource(self, resource_type, resource_id, *, name=None):
         '''
         Indicate that a given resource does not (and will not) exist.
@@ -165,6 +560,12 @@ class AwsManaged(SetupTaskMixin, AsyncInjectable):
     id = None
     readonly = None
 
+    #: Seconds for which a failed find in the completion check of
+    #:meth:`find_or_create` is trusted by the task itself, unless
+    #:the resource has since been created by this connection
+    negative_find_ttl = 10
+    _find_missed_at = None
+
     def __init__(self, *, name=None, **kwargs):
         if name and self.pass_name_to_super:
             kwargs['name'] = name
@@ -311,7 +712,10 @@ class AwsManaged(SetupTaskMixin, AsyncInjectable):
         try:
             self.mob.load()
         except ClientError:
-            if hasattr(self.mob, 'wait_until_exists'):
+            if (data := self.connection.recently_created_data(self.id)) is not None:
+                # Describe has not caught up with our own create yet
+                self.mob.meta.data = data
+            elif hasattr(self.mob, 'wait_until_exists'):
                 logger.info('Waiting for %s to exist', repr(self.mob))
                 try:
                     self.mob.wait_until_exists()
@@ -416,9 +820,12 @@ class AwsManaged(SetupTaskMixin, AsyncInjectable):
 
         # If we are called directly, rather than through setup_tasks,
         # then our check_completed will not have run, so we should
-        # explicitly try find, because double creating is bad.
+        # explicitly try find, because double creating is bad.  If it
+        # has just run and found nothing, do not look again.
 
-        await self.find()
+        missed_at, self._find_missed_at = self._find_missed_at, None
+        if not self._find_miss_trusted(missed_at):
+            await self.find()
         if self.mob:
             if not self.readonly:
                 if await run_in_executor(self.should_retag):
@@ -434,10 +841,11 @@ class AwsManaged(SetupTaskMixin, AsyncInjectable):
             raise LookupError(f'unable to find AWS resource for {self} and creation was not enabled')
 
         await self.ainjector(self.pre_create_hook)
-        await run_in_executor(self.do_create)
+        await self.create_resource()
 
         if not (self.mob or self.id):
             raise RuntimeError(f'do_create failed to create AWS resource for {self}')
+        self.connection.created_names[(self.resource_type, self.name)] = time.monotonic()
 
         if not self.mob:
             await self.find()
@@ -461,8 +869,17 @@ class AwsManaged(SetupTaskMixin, AsyncInjectable):
                 await self.ainjector(self.read_write_hook)
             await self.ainjector(self.post_find_hook)
             return True
+        self._find_missed_at = time.monotonic()
         return False
 
+    def _find_miss_trusted(self, missed_at):
+        # Whether a find that failed at *missed_at* can stand in for
+        # another; not if another object has since created us.
+        if missed_at is None or time.monotonic()-missed_at > self.negative_find_ttl:
+            return False
+        created = self.connection.created_names.get((self.resource_type, self.name))
+        return created is None or created < missed_at
+
     def _gfi(self, key, default="error"):
         '''
         get_from_injector.  Used to look up some configuration in the model or its enclosing injectors.
@@ -480,6 +897,50 @@ class AwsManaged(SetupTaskMixin, AsyncInjectable):
         '''
         raise NotImplementedError
 
+    def hydrate_created(self, resource_id, data):
+        '''
+        Set :attr:`id` and :attr:`mob` from *data*, the resource
+        description in a create response, so that
+        :meth:`find_or_create` need not describe the new resource.
+        *data* is also remembered by the connection in case a describe
+        races EC2's eventual consistency; see
+        :meth:`AwsConnection.recently_created_data`.  Run in executor
+        context.
+        '''
+        self.id = resource_id
+        self.connection.remember_created(resource_id, data)
+        if self.resource_factory_method is NotImplemented:
+            self.mob = data
+        else:
+            self.mob = getattr(self.service_resource, self.resource_factory_method)(resource_id)
+            self.mob.meta.data = data
+        return self.mob
+
+    def client_token(self, parameters):
+        '''
+        A deterministic idempotency token for creating this resource
+        with *parameters*, derived from the layout name, resource type,
+        name and a hash of the parameters.
+        '''
+        token_data = [self.config_layout.layout_name, self.resource_type, self.name, parameters]
+        return hashlib.sha256(json.dumps(token_data, sort_keys=True, default=repr).encode()).hexdigest()
+
+    def create_idempotently(self, create, stale, **parameters):
+        '''
+        Call *create* with *parameters* and a :meth:`client_token`;
+        see :func:`create_with_client_token`.  Run in executor context.
+        '''
+        return create_with_client_token(create, self.client_token(parameters), stale, **parameters)
+
+    async def create_resource(self):
+        '''
+        Called by :meth:`find_or_create` after :meth:`pre_create_hook`.
+        By default runs :meth:`do_create` in executor context.
+        Subclasses able to combine the creation of many objects into
+        one request override this.
+        '''
+        await run_in_executor(self.do_create)
+
     async def pre_create_hook(self):
         '''
         Any async tasks that need to be performed before do_create is called in executor context.
@@ -512,6 +973,14 @@ class AwsManaged(SetupTaskMixin, AsyncInjectable):
         '''
 
 
+    def owned_resource_ids(self):
+        '''
+        Ids of resources AWS manages on behalf of this object, such as
+        the instances of an auto scaling group.  They carry our tags
+        but are not orphans.
+        '''
+        return []
+
     @property
     def stamp_subdir(self):
         p = Path("aws").joinpath(self.stamp_type,str(self.id))
@@ -568,8 +1037,8 @@ class AwsManaged(SetupTaskMixin, AsyncInjectable):
 
 
 
-async def wait_for_state_change(obj, get_state_func, desired_state:str, wait_states: list[str],
-                                timeout=300):
+async def wait_for_state_change(obj, get_state_func, desired_state:str, wait_states: list[str], # pylint: disable=too-many-arguments
+                                timeout=300, *, reload=None):
     '''
     Wait for a state transition, generally for objects without a boto3 resource implementation.
     So *get_state_func* typically decomposes whatever :meth:``find_from_id` puts in *mob*.
@@ -584,6 +1053,11 @@ async def wait_for_state_change(obj, get_state_func, desired_state:str, wait_sta
 
     :param wait_states:  If one of these states persists, then continue to wait.
 
+    :param reload: An optional coroutine function taking *obj* used
+    to refresh *mob* instead of running *find_from_id* in executor
+    context.  Typically used to share one describe call among many
+    objects waiting at the same time.
+
     '''
     state = get_state_func(obj)
     logged = False
@@ -597,10 +1071,91 @@ async def wait_for_state_change(obj, get_state_func, desired_state:str, wait_sta
             logged=True
         await asyncio.sleep(5)
         timeout -= 5
-        await run_in_executor(obj.find_from_id)
+        if reload:
+            await reload(obj)
+        else:
+            await run_in_executor(obj.find_from_id)
         state = get_state_func(obj)
     raise RuntimeError(f'{obj}: {state=} is not desired state {desired_state}')
 
+#: Resource types in the order :func:`bulk_destroy` deletes them.
+#Types in the same tier do not depend on each other and are deleted
+#concurrently; types not listed are deleted last.
+destroy_tiers = (
+    ('instance', 'natgateway', 'auto_scaling_group'),
+    ('volume', 'elastic_ip', 'image', 'launch_template', 'placement_group', 'capacity_reservation'),
+    ('snapshot', 'security_group', 'route_table', 'prefix_list'),
+    ('subnet', 'internet_gateway'),
+    ('vpc',),
+)
+
+async def bulk_destroy(deployables, *, policy=destroy_policy):
+    '''
+    Delete the :class:`AwsManaged` objects among *deployables* by
+    tier (see :data:`destroy_tiers`).  Each tier is deleted
+    concurrently, so resources that batch their deletes (such as
+    :class:`~.vm.AwsVm`) share multi-id calls, and a tier starts once
+    the previous one is gone.  Readonly objects and objects whose
+    *policy* is not delete are skipped.
+
+    This is a faster alternative to
+    :func:`~carthage.deployment.run_deployment_destroy` for layouts
+    consisting of AWS resources; that function remains the general
+    path and handles non-AWS dependencies.  :func:`delete_orphans`
+    uses it to clean up orphans.
+
+    :returns: A list of (object, exception) for objects that failed to delete.
+    '''
+    tier_of = {rt: i for i, tier in enumerate(destroy_tiers) for rt in tier}
+    tiers = [[] for _ in range(len(destroy_tiers)+1)]
+    for d in deployables:
+        if not isinstance(d, AwsManaged) or d.readonly:
+            continue
+        match d.injector.get_instance(InjectionKey(policy, _optional=True)):
+            case None | DeletionPolicy.delete:
+                pass
+            case DeletionPolicy.warn:
+                logger.warning('%s retained per deletion policy', d)
+                continue
+            case _:
+                continue
+        tiers[tier_of.get(d.resource_type, len(destroy_tiers))].append(d)
+
+    async def delete(d):
+        if not d.mob:
+            await d.find()
+        if not d.mob:
+            return
+        logger.info('Deleting %s', d)
+        await d.delete()
+
+    failures = []
+    for tier in tiers:
+        results = await asyncio.gather(*(delete(d) for d in tier), return_exceptions=True)
+        for d, result in zip(tier, results):
+            if isinstance(result, Exception):
+                logger.error('Failed to delete %s: %s', d, result)
+                failures.append((d, result))
+    return failures
+
+__all__ += ['bulk_destroy', 'destroy_tiers']
+
+@inject(ainjector=AsyncInjector)
+async def delete_orphans(*, ainjector):
+    '''
+    Delete the AWS resources that the layout created but no longer
+    contains (see :meth:`AwsDeployableFinder.find_orphans`) according
+    to their *orphan_policy*, using :func:`bulk_destroy`.
+
+    :returns: As :func:`bulk_destroy`.
+    '''
+    orphans = await ainjector(find_orphan_deployables)
+    # Orphans are found readonly; they are to be deleted now.
+    clear_dry_run_marker(orphans)
+    return await bulk_destroy(orphans, policy=orphan_policy)
+
+__all__ += ['delete_orphans']
+
 class AwsDeployableFinder(DeployableFinder):
     '''
     Find any :class:`AwsManaged`.  Also, for any VPC, explicitly instantiate any networks
@@ -658,6 +1213,7 @@ class AwsDeployableFinder(DeployableFinder):
                 continue
             assert d.id is not None, f'{d} reached find_orphans without and id'
             deployed_ids.add(d.id)
+            deployed_ids.update(d.owned_resource_ids())
         results = []
         for rt, name_ids in names_by_resource_type.items():
             if not (cls := aws_type_registry.get(rt)):
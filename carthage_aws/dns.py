@@ -163,11 +163,9 @@ class AwsHostedZone(AwsManaged, DnsZone):
         await run_in_executor(callback)
 
     async def delegate_zone(self, parent):
-        def callback():
-            assert isinstance(AwsHostedZone, parent)
-            assert self.name.partition('.')[2] == parent.name
-            parent.update_records((self.name, 'NS', self.nameservers))
-        return await run_in_executor(callback)
+        assert isinstance(parent, AwsHostedZone)
+        assert self.name.partition('.')[2] == parent.name
+        return await parent.update_records((self.name, 'NS', self.nameservers))
 
     # could decorate for other actions
     async def update_records(self, *args, ttl=300):
@@ -212,14 +210,16 @@ class AwsHostedZone(AwsManaged, DnsZone):
                     }
                 }
             )
-        try:
-            _ = self.client.change_resource_record_sets(
+        def callback():
+            self.client.change_resource_record_sets(
                 HostedZoneId=self.id,
                 ChangeBatch={
                     'Comment': 'Created by Carthage',
                     'Changes': changes,
                 }
             )
+        try:
+            await run_in_executor(callback)
         except ClientError as e:
             logger.error('Could not upsert %s because %s.', args, e)
 
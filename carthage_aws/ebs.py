@@ -56,7 +56,10 @@ class AwsVolume(AwsManaged, InjectableModel):
             create_args['SnapshotId'] = self.snapshot_id
         if self.volume_size:
             create_args['Size'] = self.volume_size
-        self.mob = self.service_resource.create_volume(**create_args)
+        self.mob = self.create_idempotently(
+            self.service_resource.create_volume,
+            lambda v: v.state in ('deleting', 'deleted'),
+            **create_args)
 
     async def delete(self):
         await run_in_executor(self.mob.delete)
@@ -145,7 +148,7 @@ def attach_volume_task(*, device, volume, delete_on_termination=True):
     async def attach_volume(self, vm, volume):
         if not vm.mob:
             await vm.find_or_create()
-        volume.injector.add_provider(InjectionKey('aws_availability_zone'), vm.mob.subnet.availability_zone)
+        volume.injector.add_provider(InjectionKey('aws_availability_zone'), vm.mob.placement['AvailabilityZone'])
         await volume.async_become_ready()
         return await volume.attach(instance=vm, device=device, delete_on_termination=delete_on_termination)
 
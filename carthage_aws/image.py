@@ -5,8 +5,12 @@
 # WITHOUT ANY WARRANTY; without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
 # LICENSE for details.
+import asyncio
 import datetime
+import fnmatch
+import json
 import socket
+import time
 from pathlib import Path
 
 from carthage import *
@@ -20,15 +24,54 @@ from .ebs import AwsVolume
 __all__ = []
 
 
-def image_provider(
-        name,
-        *, owner='self',
-        architecture="x86_64",
-        all_images=False,
-        fallback=None
-        ):
-    def callback(connection):
-        r = connection.client.describe_images(
+#: In-memory image_provider results keyed by (region, owner, name,
+#architecture); values are (fetch time, sorted describe_images entries).
+_image_cache = {}
+_image_fetches = {}
+
+def _image_cache_path(config_layout):
+    return Path(config_layout.cache_dir)/'aws'/'images.json'
+
+def _read_image_cache_file(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+def _write_image_cache_file(path, key, fetched, images):
+    cache = _read_image_cache_file(path)
+    cache[key] = {'fetched': fetched, 'images': images}
+    _replace_image_cache_file(path, cache)
+
+def _replace_image_cache_file(path, cache):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(cache, default=_json_default))
+    tmp.replace(path)
+
+def _json_default(o):
+    if isinstance(o, datetime.datetime):
+        return o.isoformat()
+    raise TypeError(f'{o!r} is not JSON serializable')
+
+def _creation_date(entry):
+    creation_date = entry['CreationDate']
+    if isinstance(creation_date, datetime.datetime):
+        return creation_date
+    #AWS uses trailing Z rather than offset; datetime.datetime cannot deal with that
+    if creation_date.endswith('Z'):
+        creation_date = creation_date[:-1]+'+00:00'
+    return datetime.datetime.fromisoformat(creation_date)
+
+def _normalize_images(images):
+    # CreationDate is a datetime whether the entries come from
+    # describe_images or from the JSON cache file.
+    return [dict(image, CreationDate=_creation_date(image)) for image in images]
+
+def _describe_images_by_name(connection, owner, name, architecture):
+    paginator = connection.client.get_paginator('describe_images')
+    images = []
+    for page in paginator.paginate(
             Owners=[owner],
             Filters=[
                 {
@@ -39,20 +82,114 @@ def image_provider(
                     "Name":'architecture',
                     "Values":[architecture],
                 },
-            ]
-        )
-        images = r['Images']
-        for i in images:
-            creation_date = i['CreationDate']
-            #AWS uses trailing Z rather than offset; datetime.datetime cannot deal with that
-            creation_date = creation_date[:-1]+'+00:00'
-            i['CreationDate'] = datetime.datetime.fromisoformat(creation_date)
-        images.sort(key=lambda i: i['CreationDate'], reverse=True)
+            ]):
+        images.extend(page['Images'])
+    images = _normalize_images(images)
+    images.sort(key=_creation_date, reverse=True)
+    return images
+
+async def find_images(connection, *, name, owner='self', architecture='x86_64', refresh=False):
+    """
+    Return the ``describe_images`` entries matching *name* (which may
+    contain wildcards), newest first.  ``CreationDate`` is a
+    timezone-aware :class:`datetime.datetime`.
+
+    If ``aws.image_cache_ttl`` is set, results are cached in memory
+    and in *cache_dir*/aws/images.json for that many seconds so that
+    repeated deployments do not need to search large public catalogs.
+    Images owned by ``self`` are never cached, since they differ
+    between accounts sharing a *cache_dir* and change as images are
+    built; nor are empty results.  Concurrent lookups of the same
+    images share one search.
+
+    :param refresh: Ignore any cached result.
+    """
+    ttl = connection.config.image_cache_ttl if owner != 'self' else 0
+    key = (connection.region, owner, name, architecture)
+    file_key = ':'.join(map(str, key))
+    path = _image_cache_path(connection.config_layout)
+    now = time.time()
+    if ttl > 0 and not refresh:
+        try:
+            fetched, images = _image_cache[key]
+            if now-fetched < ttl:
+                return images
+        except KeyError:
+            pass
+        if key in _image_fetches:
+            return await asyncio.shield(_image_fetches[key])
+    future = asyncio.get_event_loop().create_future()
+    _image_fetches[key] = future
+    try:
+        images = None
+        if ttl > 0 and not refresh:
+            entry = (await run_in_executor(_read_image_cache_file, path)).get(file_key)
+            if entry and now-entry['fetched'] < ttl:
+                images = _normalize_images(entry['images'])
+                _image_cache[key] = (entry['fetched'], images)
+        if images is None:
+            images = await run_in_executor(_describe_images_by_name, connection, owner, name, architecture)
+            if ttl > 0 and images:
+                _image_cache[key] = (now, images)
+                try:
+                    await run_in_executor(_write_image_cache_file, path, file_key, now, images)
+                except OSError:
+                    logger.warning('Unable to write image cache %s', path, exc_info=True)
+        connection.remember_images(images)
+        future.set_result(images)
         return images
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # Mark retrieved in case nobody else is waiting
+        raise
+    finally:
+        if _image_fetches.get(key) is future:
+            del _image_fetches[key]
+
+__all__ += ['find_images']
+
+@inject(config_layout=ConfigLayout)
+def clear_image_cache(*, config_layout):
+    """Discard cached :func:`image_provider` results in memory and on disk.
+    """
+    _image_cache.clear()
+    _image_cache_path(config_layout).unlink(missing_ok=True)
+
+__all__ += ['clear_image_cache']
+
+def _forget_cached_images(config_layout, region, image_name):
+    # Drop cached lookups that a newly registered image named
+    # *image_name* would match.  Executor context.
+    def matches(key):
+        return key[0] == region and fnmatch.fnmatchcase(image_name, key[2])
+    for key in [k for k in list(_image_cache) if matches(k)]:
+        _image_cache.pop(key, None)
+    path = _image_cache_path(config_layout)
+    cache = _read_image_cache_file(path)
+    stale = [k for k in cache if matches(k.split(':', 3))]
+    if stale:
+        for k in stale:
+            del cache[k]
+        _replace_image_cache_file(path, cache)
+
+def image_provider( # pylint: disable=too-many-arguments
+        name,
+        *, owner='self',
+        architecture="x86_64",
+        all_images=False,
+        fallback=None,
+        refresh=False,
+        ):
+    """
+    Return a dependency provider that resolves to the newest AMI whose name matches *name*.
 
+    Lookups are cached; see :func:`find_images`.  Set *refresh* to always query AWS.
+    """
     @inject(connection=AwsConnection, injector=Injector)
     async def image_provider_inner(connection, injector):
-        images = await run_in_executor(callback, connection)
+        images = await find_images(
+            connection, name=name, owner=owner,
+            architecture=architecture, refresh=refresh)
         if len(images) == 0:
             if fallback:
                 ainjector = injector(AsyncInjector)
@@ -75,28 +212,29 @@ class AwsImage(AwsManaged):
     readonly = True
 
     async def possible_ids_for_name(self):
-        objs = self.connection.client.describe_images(
-            Owners=['self'],
-            Filters=[{
-                "Name":'name',
-                "Values": [self.name]
-            }]
-        )
+        def callback():
+            return self.connection.client.describe_images(
+                Owners=['self'],
+                Filters=[{
+                    "Name":'name',
+                    "Values": [self.name]
+                }]
+            )
+        objs = await run_in_executor(callback)
         return map(lambda o: o['ImageId'], objs['Images'])
 
     async def get_snapshots(self):
-        def callback():
-            mappings = self.mob.block_device_mappings
-            results = []
-            for m in mappings:
-                if 'Ebs' in m:
-                    results.append(self.service_resource.Snapshot(m['Ebs']['SnapshotId']))
-            return results
-        return await run_in_executor(callback)
+        metadata = await self.connection.image_metadata(self.id)
+        results = []
+        for m in metadata['BlockDeviceMappings']:
+            if 'Ebs' in m:
+                results.append(self.service_resource.Snapshot(m['Ebs']['SnapshotId']))
+        return results
 
     async def delete(self):
         snapshots = await self.get_snapshots()
         await run_in_executor(self.mob.deregister)
+        self.connection.forget_image(self.id)
         for s in snapshots:
             await run_in_executor(s.delete)
 
@@ -204,7 +342,7 @@ _bg = True, _bg_exc = False)
             if self.image_description:
                 extra['Description'] = self.image_description
             client = connection.client
-            return client.register_image(
+            response = client.register_image(
                         Name=self.name,
                 Architecture=self.architecture,
                         EnaSupport=self.ena_support,
@@ -220,6 +358,11 @@ _bg = True, _bg_exc = False)
                 RootDeviceName="/dev/xvda",
                 VirtualizationType='hvm',
             )
+            try:
+                _forget_cached_images(self.config_layout, connection.region, self.name)
+            except OSError:
+                logger.warning('Unable to update image cache', exc_info=True)
+            return response
         return await run_in_executor(callback)
 
 @inject(injector=Injector)
@@ -0,0 +1,209 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+'''
+Launch options for :class:`~.vm.AwsVm` that depend on the instance
+type, checked against the ``describe_instance_types`` entry from
+:meth:`~.connection.AwsConnection.instance_type_info` so that an
+unsupported combination fails before launch rather than in
+run_instances.
+'''
+
+from carthage.dependency_injection import *
+from carthage.network import NetworkLink
+
+__all__ = []
+
+def link_setting(l:NetworkLink, key, default=None):
+    '''
+    Look up an AWS setting for *l* the way
+    :func:`~.vm.desired_security_groups` does: on the link, else its
+    network, else *key* in the network's injector, else *default*.
+    '''
+    result = getattr(l, key, None)
+    if result is None:
+        result = getattr(l.net, key, None)
+        if result is None:
+            result = l.net.injector.get_instance(InjectionKey(key, _optional=True))
+    return default if result is None else result
+
+def interface_options(l:NetworkLink):
+    '''
+    The NetworkInterfaces entries for *l* beyond addressing and groups:
+
+    aws_interface_type
+        ``efa`` for an Elastic Fabric Adapter, ``efa-only`` for an
+        EFA without an IP device, or ``interface`` (the default).
+
+    aws_ena_express
+        True to enable ENA Express for TCP; ``udp`` to enable it for
+        UDP as well.
+
+    '''
+    options = {}
+    interface_type = link_setting(l, 'aws_interface_type')
+    if interface_type and interface_type != 'interface':
+        options['InterfaceType'] = interface_type
+    ena_express = link_setting(l, 'aws_ena_express', False)
+    if ena_express:
+        options['EnaSrdSpecification'] = {
+            'EnaSrdEnabled': True,
+            'EnaSrdUdpSpecification': {'EnaSrdUdpEnabled': ena_express == 'udp'},
+        }
+    return options
+
+__all__ += ['link_setting', 'interface_options']
+
+def validate_network_options(info, links):
+    '''
+    Check the interface options of *links* against the instance type
+    described by *info*.
+
+    :raises ValueError: if the instance type cannot support the links.
+    '''
+    instance_type = info['InstanceType']
+    network_info = info['NetworkInfo']
+    links = [l for l in links if not l.local_type]
+    if len(links) > network_info['MaximumNetworkInterfaces']:
+        raise ValueError(f'{instance_type} supports at most '
+                         f'{network_info["MaximumNetworkInterfaces"]} network interfaces, not {len(links)}')
+    options = {l.interface: interface_options(l) for l in links}
+    efa = [i for i, o in options.items() if o.get('InterfaceType', '').startswith('efa')]
+    if efa:
+        if not network_info.get('EfaSupported'):
+            raise ValueError(f'{instance_type} does not support EFA, requested for {", ".join(efa)}')
+        maximum = network_info.get('EfaInfo', {}).get('MaximumEfaInterfaces', 1)
+        if len(efa) > maximum:
+            raise ValueError(f'{instance_type} supports at most {maximum} EFA interfaces, not {len(efa)}')
+    ena_express = [i for i, o in options.items() if 'EnaSrdSpecification' in o]
+    if ena_express and not network_info.get('EnaSrdSupported'):
+        raise ValueError(f'{instance_type} does not support ENA Express, requested for {", ".join(ena_express)}')
+
+__all__ += ['validate_network_options']
+
+#: Injection keys for the performance options of :func:`performance_options`
+performance_keys = (
+    'aws_cpu_cores', 'aws_threads_per_core', 'aws_ebs_optimized',
+    'aws_cpu_credits', 'aws_metadata_hop_limit', 'aws_metadata_tokens',
+)
+
+__all__ += ['performance_keys']
+
+def performance_options(info, settings):
+    '''
+    Return the run_instances parameters for *settings*, a dict
+    mapping :data:`performance_keys` to values (None when unset):
+
+    aws_cpu_cores, aws_threads_per_core
+        *CpuOptions*; whichever is unset takes the instance type's default.
+
+    aws_ebs_optimized
+        *EbsOptimized*.
+
+    aws_cpu_credits
+        ``standard`` or ``unlimited`` for burstable instance types; *CreditSpecification*.
+
+    aws_metadata_hop_limit, aws_metadata_tokens
+        *MetadataOptions*: the PUT response hop limit, and whether
+        IMDSv2 tokens are ``optional`` or ``required``.
+
+    :raises ValueError: if the instance type described by *info* does not support a setting.
+    '''
+    instance_type = info['InstanceType']
+    results = {}
+    cores = settings.get('aws_cpu_cores')
+    threads = settings.get('aws_threads_per_core')
+    if cores is not None or threads is not None:
+        vcpu_info = info['VCpuInfo']
+        if 'ValidCores' not in vcpu_info:
+            raise ValueError(f'{instance_type} does not support CPU options')
+        cores = vcpu_info['DefaultCores'] if cores is None else cores
+        threads = vcpu_info['DefaultThreadsPerCore'] if threads is None else threads
+        if cores not in vcpu_info['ValidCores']:
+            raise ValueError(f'{instance_type} supports {vcpu_info["ValidCores"]} cores, not {cores}')
+        if threads not in vcpu_info['ValidThreadsPerCore']:
+            raise ValueError(
+                f'{instance_type} supports {vcpu_info["ValidThreadsPerCore"]} threads per core, not {threads}')
+        results['CpuOptions'] = {'CoreCount': cores, 'ThreadsPerCore': threads}
+    ebs_optimized = settings.get('aws_ebs_optimized')
+    if ebs_optimized is not None:
+        support = info.get('EbsInfo', {}).get('EbsOptimizedSupport', 'unsupported')
+        if ebs_optimized and support == 'unsupported':
+            raise ValueError(f'{instance_type} cannot be EBS optimized')
+        if not ebs_optimized and support == 'default':
+            raise ValueError(f'{instance_type} is always EBS optimized')
+        results['EbsOptimized'] = bool(ebs_optimized)
+    cpu_credits = settings.get('aws_cpu_credits')
+    if cpu_credits is not None:
+        if not info.get('BurstablePerformanceSupported'):
+            raise ValueError(f'{instance_type} is not a burstable instance type')
+        if cpu_credits not in ('standard', 'unlimited'):
+            raise ValueError(f'aws_cpu_credits must be standard or unlimited, not {cpu_credits}')
+        results['CreditSpecification'] = {'CpuCredits': cpu_credits}
+    hop_limit = settings.get('aws_metadata_hop_limit')
+    tokens = settings.get('aws_metadata_tokens')
+    if hop_limit is not None or tokens is not None:
+        metadata_options = {}
+        if hop_limit is not None:
+            if not 1 <= hop_limit <= 64:
+                raise ValueError(f'aws_metadata_hop_limit must be between 1 and 64, not {hop_limit}')
+            metadata_options['HttpPutResponseHopLimit'] = hop_limit
+        if tokens is not None:
+            if tokens not in ('optional', 'required'):
+                raise ValueError(f'aws_metadata_tokens must be optional or required, not {tokens}')
+            metadata_options['HttpTokens'] = tokens
+        results['MetadataOptions'] = metadata_options
+    return results
+
+__all__ += ['performance_options']
+
+def reconcile_performance_options(client, instance, options):
+    '''
+    Bring *instance*, a boto3 Instance, in line with *options* from
+    :func:`performance_options` where EC2 allows.  Metadata options
+    and CPU credits can change at any time; CPU options and EBS
+    optimization only while the instance is stopped.  Run in executor
+    context.
+
+    :returns: The names of the options that differ but could not be changed.
+    '''
+    instance_id = instance.id
+    stopped = instance.state['Name'] == 'stopped'
+    changed = False
+    pending = []
+    metadata_options = options.get('MetadataOptions')
+    if metadata_options and any(
+            instance.metadata_options.get(k) != v for k, v in metadata_options.items()):
+        client.modify_instance_metadata_options(InstanceId=instance_id, **metadata_options)
+        changed = True
+    credit_specification = options.get('CreditSpecification')
+    if credit_specification:
+        r = client.describe_instance_credit_specifications(InstanceIds=[instance_id])
+        current = r['InstanceCreditSpecifications'][0]['CpuCredits']
+        if current != credit_specification['CpuCredits']:
+            client.modify_instance_credit_specification(InstanceCreditSpecifications=[
+                {'InstanceId': instance_id, **credit_specification}])
+    cpu_options = options.get('CpuOptions')
+    if cpu_options and any(instance.cpu_options.get(k) != v for k, v in cpu_options.items()):
+        if stopped:
+            client.modify_instance_cpu_options(InstanceId=instance_id, **cpu_options)
+            changed = True
+        else:
+            pending.append('CpuOptions')
+    ebs_optimized = options.get('EbsOptimized')
+    if ebs_optimized is not None and instance.ebs_optimized != ebs_optimized:
+        if stopped:
+            client.modify_instance_attribute(InstanceId=instance_id, EbsOptimized={'Value': ebs_optimized})
+            changed = True
+        else:
+            pending.append('EbsOptimized')
+    if changed:
+        instance.reload()
+    return pending
+
+__all__ += ['reconcile_performance_options']
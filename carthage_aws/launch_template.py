@@ -0,0 +1,137 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+import asyncio
+import functools
+import hashlib
+import json
+
+from botocore.exceptions import ClientError
+
+from carthage import *
+from .connection import AwsConnection, AwsManaged, run_in_executor
+
+__all__ = []
+
+def _content_hash(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=repr).encode()).hexdigest()
+
+def _template_name(layout_name, template_data):
+    return f'carthage-{_content_hash([layout_name, template_data])[:32]}'
+
+class AwsLaunchTemplate(AwsManaged):
+
+    '''
+    An EC2 launch template holding the launch parameters shared by
+    identical :class:`AwsVm` configurations; see
+    :meth:`AwsVm.launch_template_data`.
+
+    Templates are content addressed: the name is derived from a hash
+    of the layout name and *template_data*, so a template is never
+    modified and launches use its default version.  Templates carry
+    the tags from the :class:`~.connection.AwsTagProvider` objects,
+    so they appear in the layout's inventory.  A template that no
+    instance or auto scaling group in the layout was launched from
+    is an orphan; see :meth:`AwsManaged.owned_resource_ids`.
+    '''
+
+    stamp_type = 'launch_template'
+    resource_type = 'launch_template'
+    resource_factory_method = NotImplemented
+
+    def __init__(self, template_data, **kwargs):
+        self.template_data = template_data
+        super().__init__(**kwargs)
+        if not self.name:
+            self.name = _template_name(self.config_layout.layout_name, template_data)
+
+    def specification(self):
+        '''The LaunchTemplate parameter for run_instances.'''
+        return {
+            'LaunchTemplateId': self.id,
+            'Version': str(self.mob['DefaultVersionNumber']),
+        }
+
+    def find_from_id(self):
+        try:
+            r = self.connection.client.describe_launch_templates(LaunchTemplateIds=[self.id])
+        except ClientError:
+            r = {'LaunchTemplates': []}
+        if r['LaunchTemplates']:
+            self.mob = r['LaunchTemplates'][0]
+        else:
+            # Describe may not yet include a template we just created
+            self.mob = self.connection.recently_created_data(self.id)
+        return self.mob
+
+    async def possible_ids_for_name(self):
+        def callback():
+            r = self.connection.client.describe_launch_templates(
+                Filters=[{'Name': 'launch-template-name', 'Values': [self.name]}])
+            return [t['LaunchTemplateId'] for t in r['LaunchTemplates']]
+        return await run_in_executor(callback)
+
+    def current_resource_tags(self):
+        if self.mob is None:
+            return None
+        return {t['Key']: t['Value'] for t in self.mob.get('Tags', [])}
+
+    def do_create(self):
+        try:
+            r = self.connection.client.create_launch_template(
+                LaunchTemplateName=self.name,
+                LaunchTemplateData=self.template_data,
+                TagSpecifications=self.resource_tags())
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'InvalidLaunchTemplateName.AlreadyExistsException':
+                raise
+            # Created concurrently elsewhere; find will pick it up.
+            return
+        self.hydrate_created(r['LaunchTemplate']['LaunchTemplateId'], r['LaunchTemplate'])
+
+    async def create_resource(self):
+        await super().create_resource()
+        if not self.mob:
+            await self.find()
+
+    async def delete(self):
+        # A later launch_template_for must find or create it afresh
+        self.connection.launch_templates.pop(self.name, None)
+        self.connection.forget_created(self.id)
+        await run_in_executor(functools.partial(
+            self.connection.client.delete_launch_template, LaunchTemplateId=self.id))
+
+__all__ += ['AwsLaunchTemplate']
+
+async def launch_template_for(ainjector, template_data):
+    '''
+    Return the ready :class:`AwsLaunchTemplate` for *template_data*,
+    finding or creating it once per connection however many VMs
+    share the configuration.
+    '''
+    connection = await ainjector.get_instance_async(AwsConnection)
+    name = _template_name(connection.config_layout.layout_name, template_data)
+    try:
+        return await asyncio.shield(connection.launch_templates[name])
+    except KeyError:
+        pass
+    future = asyncio.get_event_loop().create_future()
+    connection.launch_templates[name] = future
+    try:
+        template = await ainjector(
+            AwsLaunchTemplate, template_data=template_data,
+            name=name, id=None, readonly=False)
+        future.set_result(template)
+        return template
+    except Exception as e:
+        del connection.launch_templates[name]
+        future.set_exception(e)
+        future.exception()  # Mark retrieved in case nobody else is waiting
+        raise
+
+__all__ += ['launch_template_for']
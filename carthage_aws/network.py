@@ -5,9 +5,12 @@
 # WITHOUT ANY WARRANTY; without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
 # LICENSE for details.
+# pylint: disable=too-many-lines
 
 from __future__ import annotations
+import asyncio
 import dataclasses
+import functools
 import ipaddress
 import typing
 import warnings
@@ -91,7 +94,7 @@ class AwsVirtualPrivateCloud(AwsManaged, ModelContainer):
                     InstanceTenancy='default',
                                                       CidrBlock=self.vpc_cidr,
                     TagSpecifications=self.resource_tags())
-            self.id = r['Vpc']['VpcId']
+            self.hydrate_created(r['Vpc']['VpcId'], r['Vpc'])
 
 
             make_ig = True
@@ -139,22 +142,26 @@ class AwsVirtualPrivateCloud(AwsManaged, ModelContainer):
         return self.groups
 
     async def delete(self):
-        for sn in self.mob.subnets.all():
-            await run_in_executor(sn.delete)
-        for g in self.mob.security_groups.all():
-            try:
-                await run_in_executor(g.delete)
-            except Exception:
-                pass
-        for gw in self.mob.internet_gateways.all():
-            gw.detach_from_vpc(VpcId=self.id)
-            gw.delete()
-        for rt in self.mob.route_tables.all():
-            try:
-                rt.delete()
-            except Exception:
-                pass
-        await run_in_executor(self.mob.delete)
+        self.connection.forget_created(self.id)
+        def callback():
+            # Listing the collections makes API calls too
+            for sn in self.mob.subnets.all():
+                sn.delete()
+            for g in self.mob.security_groups.all():
+                try:
+                    g.delete()
+                except Exception:
+                    pass
+            for gw in self.mob.internet_gateways.all():
+                gw.detach_from_vpc(VpcId=self.id)
+                gw.delete()
+            for rt in self.mob.route_tables.all():
+                try:
+                    rt.delete()
+                except Exception:
+                    pass
+            self.mob.delete()
+        await run_in_executor(callback)
 
     async def read_write_hook(self):
         def callback():
@@ -167,18 +174,33 @@ class AwsVirtualPrivateCloud(AwsManaged, ModelContainer):
         await run_in_executor(callback)
 
 
+@functools.lru_cache(maxsize=16384)
+def _intern_network(cidr):
+    # Rules repeat the same CIDRs across groups and deploys; parse
+    # each only once and share the resulting object.
+    return ipaddress.IPv4Network(cidr)
+
+@functools.lru_cache(maxsize=4096)
+def _intern_cidr_set(cidrs:tuple):
+    return frozenset(map(_intern_network, cidrs))
+
 @dataclasses.dataclass(frozen=True)
 class SgRule:
 
-    cidr: frozenset[ipaddress.IPv4Network]
+    cidr: frozenset[ipaddress.IPv4Network] = frozenset()
     port: typing.Union[int, tuple[int,int]] = (-1, -1)
     proto: typing.Union[str,int] = 'tcp'
     description: str = ""
+    #: An :class:`AwsManagedPrefixList`, an :class:`InjectionKey`
+    #providing one, or a prefix list id.  The rule applies to the
+    #prefix list's entries in addition to *cidr*.
+    prefix_list: typing.Any = None
+
     @staticmethod
     def _handle_cidr(cidr_in):
         if isinstance(cidr_in, (ipaddress.IPv4Network, str)):
             cidr_in = [cidr_in]
-        cidr_out = frozenset(map(lambda cidr: ipaddress.IPv4Network(cidr), cidr_in))
+        cidr_out = _intern_cidr_set(tuple(cidr_in))
         allzeros_32 = ipaddress.IPv4Network('0.0.0.0/32')
         for e in cidr_out:
             if e == allzeros_32:
@@ -206,12 +228,15 @@ class SgRule:
             ip_ranges.append({"CidrIp": str(ip)})
             if i == 0 and self.description:
                 ip_ranges[0]['Description'] = self.description
-        return {
+        result = {
             "IpProtocol":str(self.proto),
             "FromPort":self.port[0],
             "ToPort":self.port[1],
             "IpRanges":ip_ranges
         }
+        if isinstance(self.prefix_list, str):
+            result['PrefixListIds'] = [{'PrefixListId': self.prefix_list}]
+        return result
 
     @classmethod
     def from_ip_permission(cls, permission):
@@ -230,6 +255,99 @@ class SgRule:
             port=(permission['FromPort'], permission['ToPort']),
             description=description)
 
+_proto_names = {'6': 'tcp', '17': 'udp', '1': 'icmp'}
+
+def _sg_atom(proto, port, description, network):
+    # The unit in which rule sets are compared: one (proto, ports,
+    # description, destination).  Normalized the way EC2 reports
+    # permissions back to us.
+    proto = _proto_names.get(str(proto), str(proto))
+    if proto == '-1':
+        port = (-1, -1)
+    return (proto, port, description, network)
+
+@dataclasses.dataclass(frozen=True)
+class CompiledSgRules:
+
+    '''The result of :func:`compile_sg_rules`.'''
+
+    #: frozenset of (proto, port, description, network) after aggregation
+    atoms: frozenset
+
+    @functools.cached_property
+    def ip_permissions(self):
+        return sg_ip_permissions(self.atoms)
+
+@functools.lru_cache(maxsize=1024)
+def _compile_sg_rules(rules:frozenset):
+    by_key = {}
+    for rule in rules:
+        key = _sg_atom(rule.proto, rule.port, rule.description, None)[:3]
+        by_key.setdefault(key, set()).update(rule.cidr)
+    atoms = set()
+    for key, networks in by_key.items():
+        for network in ipaddress.collapse_addresses(networks):
+            atoms.add((*key, _intern_network(network)))
+    for rule in rules:
+        if rule.prefix_list is None:
+            continue
+        if not isinstance(rule.prefix_list, str):
+            raise TypeError(f'{rule}: prefix list must be resolved to an id before compiling')
+        atoms.add(_sg_atom(rule.proto, rule.port, rule.description, rule.prefix_list))
+    return CompiledSgRules(atoms=frozenset(atoms))
+
+def compile_sg_rules(rules) -> CompiledSgRules:
+    '''
+    Compile a collection of :class:`SgRule` for comparison with and
+    submission to EC2.  Rules with the same protocol, ports and
+    description are merged, and their CIDRs are collapsed so that
+    adjacent and contained networks become as few entries as
+    possible.  Results are cached, so groups sharing large
+    allow-lists compile them once.
+    '''
+    return _compile_sg_rules(frozenset(rules))
+
+def sg_atoms_from_permissions(permissions):
+    '''Decompose IpPermissions as returned by EC2 into atoms comparable with :attr:`CompiledSgRules.atoms`.
+    Only IPv4 ranges are considered.
+    '''
+    atoms = set()
+    for permission in permissions:
+        port = (permission.get('FromPort', -1), permission.get('ToPort', -1))
+        for ip_range in permission.get('IpRanges', []):
+            atoms.add(_sg_atom(
+                permission['IpProtocol'], port,
+                ip_range.get('Description', ''),
+                _intern_network(ip_range['CidrIp'])))
+        for prefix_list in permission.get('PrefixListIds', []):
+            atoms.add(_sg_atom(
+                permission['IpProtocol'], port,
+                prefix_list.get('Description', ''),
+                prefix_list['PrefixListId']))
+    return atoms
+
+def sg_ip_permissions(atoms, *, descriptions=True):
+    '''Build an IpPermissions payload from atoms, one permission per protocol and port range.
+    Atoms whose destination is a string are prefix list ids.
+    '''
+    permissions = {}
+    for proto, port, description, network in sorted(atoms, key=str):
+        permission = permissions.setdefault((proto, port), {
+            'IpProtocol': proto,
+            'FromPort': port[0],
+            'ToPort': port[1],
+            'IpRanges': []})
+        if isinstance(network, str):
+            entry = {'PrefixListId': network}
+            permission.setdefault('PrefixListIds', []).append(entry)
+        else:
+            entry = {'CidrIp': str(network)}
+            permission['IpRanges'].append(entry)
+        if description and descriptions:
+            entry['Description'] = description
+    return list(permissions.values())
+
+__all__ += ['compile_sg_rules']
 
 @inject_autokwargs(vpc=AwsVirtualPrivateCloud)
 class AwsSecurityGroup(AwsManaged, InjectableModel):
@@ -321,32 +439,69 @@ class AwsSecurityGroup(AwsManaged, InjectableModel):
             lambda permission:SgRule.from_ip_permission(permission),
             self.mob.ip_permissions))
 
-    async def read_write_hook(self):
-        def callback():
-            existing_egress = self.existing_egress
-            existing_ingress = self.existing_ingress
-            expected_ingress = set(self.ingress_rules)
-            expected_egress = set(self.egress_rules)
-
-            if expected_egress-existing_egress:
-                self.mob.authorize_egress(
-                IpPermissions=[ x.to_ip_permission() for x in expected_egress-existing_egress],
-                    )
-
-            if expected_ingress-existing_ingress:
-                self.mob.authorize_ingress(
-                IpPermissions=[ x.to_ip_permission() for x in expected_ingress-existing_ingress ],
-                )
+    def _reconcile(self, direction, rules, permissions):
+        # Executor context.  Returns True if changes were made.
+        expected = compile_sg_rules(rules).atoms
+        existing = sg_atoms_from_permissions(permissions)
+        limit = self._gfi('aws_security_group_rule_limit', default=60)
+        if len(expected) > limit:
+            logger.warning('%s: %d %s rules exceeds the per-group limit of %d',
+                           self, len(expected), direction, limit)
+        to_add = expected - existing
+        to_remove = existing - expected
+        # Entries that differ only in description are updated in place
+        # rather than revoked and authorized again.
+        add_keys = {(a[0], a[1], a[3]) for a in to_add}
+        redescribe_keys = {(a[0], a[1], a[3]) for a in to_remove} & add_keys
+        redescribe = {a for a in to_add if (a[0], a[1], a[3]) in redescribe_keys}
+        to_add -= redescribe
+        to_remove = {a for a in to_remove if (a[0], a[1], a[3]) not in redescribe_keys}
+        suffix = '' if direction == 'ingress' else '_egress'
+        if to_add:
+            getattr(self.mob, 'authorize'+suffix)(IpPermissions=sg_ip_permissions(to_add))
+        if redescribe:
+            getattr(self.connection.client, f'update_security_group_rule_descriptions_{direction}')(
+                GroupId=self.id, IpPermissions=sg_ip_permissions(redescribe))
+        if to_remove:
+            getattr(self.mob, 'revoke'+suffix)(IpPermissions=sg_ip_permissions(to_remove, descriptions=False))
+        return bool(to_add or redescribe or to_remove)
+
+    async def _resolve_prefix_lists(self, rules, ready=True):
+        '''Return *rules* with any prefix list reference replaced by its id.
+        If *ready* is False, return the unready prefix list objects instead.
+        '''
+        results = []
+        for rule in rules:
+            prefix_list = rule.prefix_list
+            if prefix_list is None or isinstance(prefix_list, str):
+                if ready:
+                    results.append(rule)
+                continue
+            if isinstance(prefix_list, InjectionKey):
+                prefix_list = await self.ainjector.get_instance_async(
+                    InjectionKey(prefix_list, _ready=False))
+            if not ready:
+                results.append(prefix_list)
+                continue
+            await prefix_list.async_become_ready()
+            results.append(dataclasses.replace(rule, prefix_list=prefix_list.id))
+        return results
 
-            if existing_egress-expected_egress:
-                self.mob.revoke_egress(
-                    IpPermissions=[x.to_ip_permission() for x in existing_egress-expected_egress],
-                    )
+    async def dynamic_dependencies(self):
+        with instantiation_not_ready():
+            return [
+                *await self._resolve_prefix_lists(self.ingress_rules, ready=False),
+                *await self._resolve_prefix_lists(self.egress_rules, ready=False),
+                ]
 
-            if existing_ingress-expected_ingress:
-                self.mob.revoke_ingress(
-                                IpPermissions=[x.to_ip_permission() for x in existing_ingress-expected_ingress],
-                            )
+    async def read_write_hook(self):
+        ingress_rules = await self._resolve_prefix_lists(self.ingress_rules)
+        egress_rules = await self._resolve_prefix_lists(self.egress_rules)
+        def callback():
+            changed = self._reconcile('egress', egress_rules, self.mob.ip_permissions_egress)
+            changed = self._reconcile('ingress', ingress_rules, self.mob.ip_permissions) or changed
+            if changed:
+                self.mob.reload()
 
         if not self.readonly:
             await run_in_executor(callback)
@@ -377,6 +532,77 @@ class AwsSecurityGroup(AwsManaged, InjectableModel):
 
 
 
+class SubnetAddressIndex:
+
+    '''
+    The private addresses of an AWS subnet.  Containment is a
+    constant time range check excluding the addresses AWS reserves:
+    the network address, the next three (router, DNS and future use)
+    and the broadcast address.  Addresses in use are tracked in a
+    bitmap from which :meth:`allocate` hands out free addresses.
+
+    Typically obtained with :meth:`AwsSubnet.address_index`, which
+    marks the addresses of existing network interfaces as used.
+    '''
+
+    #: Addresses AWS reserves at the start and end of every subnet
+    reserved_low = 4
+    reserved_high = 1
+
+    def __init__(self, network):
+        self.network = ipaddress.IPv4Network(network)
+        self._base = int(self.network.network_address)
+        self._size = self.network.num_addresses
+        self._used = bytearray((self._size+7)//8)
+        self._hint = self.reserved_low
+
+    def _offset(self, address):
+        offset = int(ipaddress.IPv4Address(address))-self._base
+        if not self.reserved_low <= offset < self._size-self.reserved_high:
+            raise ValueError(f'{address} is not an assignable address in {self.network}')
+        return offset
+
+    def __contains__(self, address):
+        offset = int(ipaddress.IPv4Address(address))-self._base
+        return self.reserved_low <= offset < self._size-self.reserved_high
+
+    def is_used(self, address):
+        offset = self._offset(address)
+        return bool(self._used[offset >> 3] & (1 << (offset & 7)))
+
+    def mark_used(self, address):
+        '''Record *address* as in use.  Addresses outside the subnet are ignored.'''
+        if address in self:
+            offset = self._offset(address)
+            self._used[offset >> 3] |= 1 << (offset & 7)
+
+    def release(self, address):
+        offset = self._offset(address)
+        self._used[offset >> 3] &= ~(1 << (offset & 7)) & 0xff
+        self._hint = min(self._hint, offset)
+
+    def allocate(self):
+        '''
+        Return the lowest free address and mark it used.
+
+        :raises LookupError: if the subnet is full.
+        '''
+        end = self._size-self.reserved_high
+        offset = self._hint
+        while offset < end:
+            byte = self._used[offset >> 3]
+            if byte == 0xff:
+                offset = (offset | 7)+1
+                continue
+            if not byte & (1 << (offset & 7)):
+                self._used[offset >> 3] = byte | (1 << (offset & 7))
+                self._hint = offset+1
+                return ipaddress.IPv4Address(self._base+offset)
+            offset += 1
+        raise LookupError(f'No free addresses in {self.network}')
+
+__all__ += ['SubnetAddressIndex']
+
 # Decorated also with injection for route table after it is defined.
 @inject_autokwargs(connection = InjectionKey(AwsConnection),
                    network=this_network,
@@ -428,6 +654,35 @@ class AwsSubnet(TechnologySpecificNetwork, AwsManaged):
                 return [s['id']]
         return []
 
+    async def address_index(self):
+        '''
+        Return the :class:`SubnetAddressIndex` for this subnet with
+        the private addresses of its existing network interfaces
+        marked used.  Loaded once per connection and then shared, so
+        addresses handed out by :meth:`SubnetAddressIndex.allocate`
+        are not handed out twice.
+        '''
+        indexes = self.connection.address_indexes
+        if self.id not in indexes:
+            indexes[self.id] = asyncio.ensure_future(run_in_executor(self._load_address_index))
+        future = indexes[self.id]
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            if indexes.get(self.id) is future:
+                del indexes[self.id]
+            raise
+
+    def _load_address_index(self):
+        # Executor context
+        index = SubnetAddressIndex(self.mob.cidr_block)
+        paginator = self.connection.client.get_paginator('describe_network_interfaces')
+        for page in paginator.paginate(Filters=[{'Name': 'subnet-id', 'Values': [self.id]}]):
+            for interface in page['NetworkInterfaces']:
+                for address in interface['PrivateIpAddresses']:
+                    index.mark_used(address['PrivateIpAddress'])
+        return index
+
     async def post_find_hook(self):
         '''
         Set v4_config if we do not have one.
@@ -453,7 +708,9 @@ class AwsSubnet(TechnologySpecificNetwork, AwsManaged):
                                                      TagSpecifications=self.resource_tags(),
                                                      **extra_args
                                                      )
-            self.id = r['Subnet']['SubnetId']
+            self.hydrate_created(r['Subnet']['SubnetId'], r['Subnet'])
+            self.connection.subnets.append({
+                'CidrBlock': r['Subnet']['CidrBlock'], 'id': self.id, 'vpc': self.vpc.id})
             # No need to associate subnet with main route table
 
         except ClientError as e:
@@ -466,6 +723,7 @@ class AwsSubnet(TechnologySpecificNetwork, AwsManaged):
             await self.route_table.associate_subnet(self)
 
     async def delete(self):
+        self.connection.forget_created(self.id)
         await self.find()
         if not self.mob:
             return
@@ -481,6 +739,7 @@ class VpcAddress(AwsManaged):
 
     stamp_type = 'elastic_ip'
     ip_address = None
+    _claimed_reserve = False
 
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
@@ -489,17 +748,24 @@ class VpcAddress(AwsManaged):
 
     async def find(self):
         '''If ip_address is set and id is not, then try to find an ip_address matching.
+        The address is looked up in the address pool loaded by :class:`AwsConnection`
+        inventory; only addresses allocated since then require a describe call.
         '''
         def callback():
             return self.connection.client.describe_addresses(
                 PublicIps=[self.ip_address])
 
         if self.ip_address and not self.id:
-            try:
-                r = await run_in_executor(callback)
-            except ClientError as exc:
-                raise LookupError('IP address specified but does not exist') from exc
-            self.id = r['Addresses'][0]['AllocationId']
+            await self.connection.async_become_ready()
+            address = self.connection.addresses.get(str(self.ip_address))
+            if address is None:
+                try:
+                    r = await run_in_executor(callback)
+                except ClientError as exc:
+                    raise LookupError('IP address specified but does not exist') from exc
+                address = r['Addresses'][0]
+                self.connection.remember_address(address)
+            self.id = address['AllocationId']
         res =  await super().find()
         if self.mob:
             self.ip_address = self.mob.public_ip
@@ -507,12 +773,29 @@ class VpcAddress(AwsManaged):
 
     def do_create(self):
         #executor context
+        tags = self.resource_tags()
+        address = self.connection.claim_reserved_address(tags[0]['Tags'])
+        if address:
+            logger.info('%s claimed %s from the address reserve', self, address['PublicIp'])
+            self._claimed_reserve = True
+            self.hydrate_created(address['AllocationId'], address)
+            return
         r = self.connection.client.allocate_address(Domain='vpc',
-                                                    TagSpecifications=self.resource_tags())
-        self.id = r['AllocationId']
-
+                                                    TagSpecifications=tags)
+        address = {
+            'PublicIp': r['PublicIp'],
+            'AllocationId': r['AllocationId'],
+            'Domain': r['Domain'],
+            'Tags': tags[0]['Tags']}
+        self.connection.remember_address(address)
+        self.hydrate_created(r['AllocationId'], address)
+
+    async def post_create_hook(self):
+        if self._claimed_reserve:
+            self.connection.schedule_address_reserve_replenish()
 
     async def delete(self):
+        self.connection.forget_created(self.id)
         if self.mob:
             try:
                 await run_in_executor(self.mob.load)
@@ -521,9 +804,184 @@ class VpcAddress(AwsManaged):
             except Exception:
                 pass
             await run_in_executor(self.mob.release)
+            self.connection.forget_address(self.mob.public_ip)
 
 __all__ += ['VpcAddress']
 
+class AwsManagedPrefixList(AwsManaged, InjectableModel):
+
+    '''
+    A customer-managed prefix list.  Large CIDR sets shared among
+    many security groups and route tables can be kept in a prefix
+    list and referenced with ``SgRule(prefix_list=...)`` or as the
+    destination of an :attr:`AwsRouteTable.routes` entry.  Changing
+    the list is then one versioned ``modify_managed_prefix_list``
+    call rather than rewriting every group and route table.
+
+    :param entries: A sequence of CIDRs or of (CIDR, description) tuples.
+
+    :param max_entries: The maximum number of entries.  Note that
+        each security group referencing the list consumes this many
+        rules.  Defaults to the number of entries.
+
+    '''
+
+    stamp_type = 'prefix_list'
+    resource_type = 'prefix_list'
+    resource_factory_method = NotImplemented
+
+    entries: typing.Sequence = ()
+    max_entries: int = None
+    address_family = 'IPv4'
+
+    #: Entries per modify call permitted by EC2
+    max_entries_per_request = 100
+
+    def __init__(self, **kwargs):
+        for k in ('entries', 'max_entries'):
+            if k in kwargs:
+                setattr(self, k, kwargs.pop(k))
+        super().__init__(**kwargs)
+        self.current_entries = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.name:
+            provides(InjectionKey(AwsManagedPrefixList, name=cls.name))(cls)
+
+    def expected_entries(self):
+        '''A dict mapping CIDRs to descriptions.'''
+        results = {}
+        for entry in self.entries:
+            if isinstance(entry, (str, ipaddress.IPv4Network)):
+                cidr, description = entry, ''
+            else:
+                cidr, description = entry
+            results[str(_intern_network(cidr))] = description
+        return results
+
+    def find_from_id(self):
+        try:
+            r = self.connection.client.describe_managed_prefix_lists(PrefixListIds=[self.id])
+        except ClientError:
+            r = {'PrefixLists': []}
+        for prefix_list in r['PrefixLists']:
+            if prefix_list['State'].startswith('delete'):
+                continue
+            self.mob = prefix_list
+            break
+        else:
+            # Entries of a list we just created are already in current_entries
+            self.mob = self.connection.recently_created_data(self.id)
+            return self.mob
+        self.current_entries = {}
+        paginator = self.connection.client.get_paginator('get_managed_prefix_list_entries')
+        for page in paginator.paginate(PrefixListId=self.id):
+            for entry in page['Entries']:
+                self.current_entries[entry['Cidr']] = entry.get('Description', '')
+        return self.mob
+
+    async def possible_ids_for_name(self):
+        ids = await super().possible_ids_for_name()
+        if ids:
+            return ids
+        def callback():
+            r = self.connection.client.describe_managed_prefix_lists(
+                Filters=[{'Name': 'prefix-list-name', 'Values': [self.name]}])
+            return [p['PrefixListId'] for p in r['PrefixLists'] if p['OwnerId'] != 'AWS']
+        return await run_in_executor(callback)
+
+    def current_resource_tags(self):
+        if self.mob is None:
+            return None
+        return {t['Key']: t['Value'] for t in self.mob.get('Tags', [])}
+
+    @staticmethod
+    def _entry_list(entries):
+        return [
+            {'Cidr': cidr, 'Description': description} if description else {'Cidr': cidr}
+            for cidr, description in entries.items()]
+
+    def do_create(self):
+        # Any entries beyond what one request allows are added by read_write_hook.
+        expected = self.expected_entries()
+        entries = dict(list(expected.items())[:self.max_entries_per_request])
+        r = self.create_idempotently(
+            self.connection.client.create_managed_prefix_list,
+            lambda r: r['PrefixList']['State'].startswith('delete'),
+            PrefixListName=self.name,
+            Entries=self._entry_list(entries),
+            MaxEntries=self.max_entries or max(len(expected), 1),
+            AddressFamily=self.address_family,
+            TagSpecifications=self.resource_tags(),
+        )
+        self.hydrate_created(r['PrefixList']['PrefixListId'], r['PrefixList'])
+        self.current_entries = entries
+
+    async def wait_for_complete(self):
+        await wait_for_state_change(
+            self, lambda obj: 'complete' if obj.mob['State'].endswith('-complete') else obj.mob['State'],
+            'complete', ['create-in-progress', 'modify-in-progress', 'restore-in-progress'])
+
+    def _modify_entries(self, add, remove):
+        # Executor context
+        self.connection.client.modify_managed_prefix_list(
+            PrefixListId=self.id,
+            CurrentVersion=self.mob['Version'],
+            AddEntries=self._entry_list(add),
+            RemoveEntries=[{'Cidr': cidr} for cidr in remove])
+        self.find_from_id()
+
+    async def read_write_hook(self):
+        await self.wait_for_complete()
+        expected = self.expected_entries()
+        current = self.current_entries
+        # AddEntries cannot change the description of an existing
+        # CIDR, so a changed description is a remove and a later add.
+        to_add = {cidr: d for cidr, d in expected.items() if current.get(cidr) != d}
+        to_remove = [cidr for cidr in current if cidr not in expected or cidr in to_add]
+        if not (to_add or to_remove):
+            return
+        max_entries = max(self.max_entries or 0, len(expected))
+        if max_entries > self.mob['MaxEntries']:
+            # MaxEntries cannot be changed in the same request as entries
+            def resize():
+                self.connection.client.modify_managed_prefix_list(
+                    PrefixListId=self.id, MaxEntries=max_entries)
+                self.find_from_id()
+            logger.info('Resizing %s to %d entries', self, max_entries)
+            await run_in_executor(resize)
+            await self.wait_for_complete()
+        add_items = list(to_add.items())
+        while add_items or to_remove:
+            remove_batch = to_remove[:self.max_entries_per_request]
+            to_remove = to_remove[len(remove_batch):]
+            # Only add a CIDR once a previous request has removed it
+            still_present = set(remove_batch) | set(to_remove)
+            add_batch = {}
+            for item in add_items:
+                if len(add_batch) + len(remove_batch) >= self.max_entries_per_request:
+                    break
+                if item[0] not in still_present:
+                    add_batch[item[0]] = item[1]
+            add_items = [item for item in add_items if item[0] not in add_batch]
+            logger.info('Updating %s: adding %d and removing %d entries',
+                        self, len(add_batch), len(remove_batch))
+            await run_in_executor(self._modify_entries, add_batch, remove_batch)
+            await self.wait_for_complete()
+
+    async def delete(self):
+        self.connection.forget_created(self.id)
+        def callback():
+            self.connection.client.delete_managed_prefix_list(PrefixListId=self.id)
+        if not self.mob:
+            await self.find()
+        if not self.mob:
+            return
+        await run_in_executor(callback)
+
+__all__ += ['AwsManagedPrefixList']
+
 
 
 @inject(vm=InjectionKey(carthage.machine.Machine, _ready=False),
@@ -540,6 +998,11 @@ async def network_for_existing_vm(vm, security_groups):
     This will look up the network associated with an existing VM
     and instantiate it in the model.  It can be used for example as an up-propagation
     to put another new instance on the same network.
+
+    Subnet details come from the :class:`AwsConnection` inventory,
+    and the generated network is shared among all VMs on the same
+    subnet (with the same *security_groups*), so placing many
+    instances next to existing ones costs one lookup per subnet.
     '''
     from .vm import AwsVm
     from carthage.modeling import NetworkModel
@@ -548,30 +1011,48 @@ async def network_for_existing_vm(vm, security_groups):
     await vm.find()
     if not vm.mob:
         raise LookupError(f'Failed to find existing {vm}')
-    vpc_id =vm.mob.subnet.vpc_id
-    try:
-        vpc = await vm.ainjector.get_instance_async(InjectionKey(AwsVirtualPrivateCloud, id=vpc_id, _ready=False))
-    except KeyError:
-        vpc = None
-    class vm_network(NetworkModel):
-        v4_config = V4Config(network=vm.mob.subnet.cidr_block)
-        if security_groups is not None:
-            for sg in security_groups:
-                add_provider(sg, force_multiple_instantiate=True)
-            try:
-                del sg # pylint: disable=undefined-loop-variable
-            except NameError:
-                pass
-        if vpc:
-            add_provider(
-                InjectionKey(AwsVirtualPrivateCloud),
-                injector_xref(None, InjectionKey(AwsVirtualPrivateCloud, id=vpc_id))
-            )
-        else:
-            add_provider(InjectionKey(AwsVirtualPrivateCloud),
-                         when_needed(AwsVirtualPrivateCloud, id=vpc_id))
+    connection = vm.connection
+    subnet = await connection.subnet_info(vm.mob.subnet_id)
+    vpc_id = subnet['vpc']
+
+    async def generate_network():
+        try:
+            vpc = await vm.ainjector.get_instance_async(InjectionKey(AwsVirtualPrivateCloud, id=vpc_id, _ready=False))
+        except KeyError:
+            vpc = None
+        class vm_network(NetworkModel):
+            v4_config = V4Config(network=subnet['CidrBlock'])
+            if security_groups is not None:
+                for sg in security_groups:
+                    add_provider(sg, force_multiple_instantiate=True)
+                try:
+                    del sg # pylint: disable=undefined-loop-variable
+                except NameError:
+                    pass
+            if vpc:
+                add_provider(
+                    InjectionKey(AwsVirtualPrivateCloud),
+                    injector_xref(None, InjectionKey(AwsVirtualPrivateCloud, id=vpc_id))
+                )
+            else:
+                add_provider(InjectionKey(AwsVirtualPrivateCloud),
+                             when_needed(AwsVirtualPrivateCloud, id=vpc_id))
 
-    return await vm.ainjector(vm_network)
+        return await vm.ainjector(vm_network)
+
+    try:
+        cache_key = (subnet['id'], tuple(security_groups or ()))
+        hash(cache_key)
+    except TypeError:
+        return await generate_network()
+    networks = connection.existing_vm_networks
+    if cache_key not in networks:
+        networks[cache_key] = asyncio.ensure_future(generate_network())
+    try:
+        return await asyncio.shield(networks[cache_key])
+    except Exception:
+        networks.pop(cache_key, None)
+        raise
 
 __all__ += ['network_for_existing_vm']
 
@@ -608,9 +1089,12 @@ class AwsRouteTable(AwsManaged):
                 raise ValueError(f'unknown target type for: {target}')
 
         kwargs = {
-            'DestinationCidrBlock': destination,
             f'{kind}Id': target.id
         }
+        if isinstance(destination, AwsManagedPrefixList):
+            kwargs['DestinationPrefixListId'] = destination.id
+        else:
+            kwargs['DestinationCidrBlock'] = destination
         try:
             self.mob.create_route(**kwargs)
         except ClientError as e:
@@ -633,6 +1117,8 @@ class AwsRouteTable(AwsManaged):
                 "kind":kind
         }
         )
+        if isinstance(destination, AwsManagedPrefixList):
+            await destination.async_become_ready()
         await run_in_executor(self._add_route, destination, target, kind)
 
     async def associate_subnet(self, subnet):
@@ -643,11 +1129,15 @@ class AwsRouteTable(AwsManaged):
     async def set_routes(self, *routes):
         def callback():
             numlocal = 0
-            for r in list(reversed(self.mob.routes)):
-                if r.gateway_id == 'local':
+            for r in list(reversed(self.mob.routes_attribute)):
+                if r.get('GatewayId') == 'local':
                     numlocal += 1
-                else:
-                    r.delete()
+                    continue
+                # Not Route.delete(), which only handles CIDR destinations
+                for k in ('DestinationCidrBlock', 'DestinationPrefixListId', 'DestinationIpv6CidrBlock'):
+                    if k in r:
+                        self.connection.client.delete_route(RouteTableId=self.id, **{k: r[k]})
+                        break
             assert numlocal == 1
             self.mob.load()
         await run_in_executor(callback)
@@ -656,6 +1146,7 @@ class AwsRouteTable(AwsManaged):
         await run_in_executor(self.mob.load)
 
     async def delete(self):
+        self.connection.forget_created(self.id)
         if hasattr(self, 'association'):
             logger.info("Deleting association for %s and %s", self, self.association)
             await run_in_executor(self.association.delete)
@@ -668,7 +1159,7 @@ class AwsRouteTable(AwsManaged):
                     VpcId=self.vpc.id,
                     TagSpecifications=self.resource_tags()
             )
-            self.id = r['RouteTable']['RouteTableId']
+            self.hydrate_created(r['RouteTable']['RouteTableId'], r['RouteTable'])
         except ClientError as e:
             logger.error('Could not create AwsRouteTable %s due to %s.', self.name, e)
 
@@ -689,11 +1180,21 @@ class AwsRouteTable(AwsManaged):
     async def dynamic_dependencies(self):
         '''
         See :func:`carthage.deployment.Deployable.dynamic_dependencies` for documentation.
-        Returns dependencies for any routes
+        Returns dependencies for any routes, including managed prefix list destinations.
         '''
         results = []
         with instantiation_not_ready():
             for destination, target, *rest in self.routes:
+                destination = await resolve_deferred(
+                    self.ainjector,
+                    destination,
+                    args={
+                        "target": target,
+                        "kind": rest[0] if len(rest) else None
+                    }
+                )
+                if isinstance(destination, AwsManagedPrefixList):
+                    results.append(destination)
                 target = await resolve_deferred(
                     self.ainjector,
                     target,
@@ -773,7 +1274,7 @@ class AwsInternetGateway(AwsManaged):
         r = self.connection.client.create_internet_gateway(
                 TagSpecifications=self.resource_tags()
         )
-        self.id = r['InternetGateway']['InternetGatewayId']
+        self.hydrate_created(r['InternetGateway']['InternetGatewayId'], r['InternetGateway'])
 
     async def read_write_hook(self):
         if self.vpc:
@@ -855,6 +1356,20 @@ class AwsNatGateway(carthage.machine.NetworkedModel, AwsManaged, InjectableModel
                             'Values': [self.id]}])
         self._tags = r['Tags']
 
+    async def reload(self):
+        '''Refresh *mob*.  NAT gateways that reload at about the same
+        time share a single ``describe_nat_gateways`` call, so waiting
+        for many gateways costs one request per poll interval.
+        '''
+        batcher = self.connection.batcher(
+            'describe_nat_gateways',
+            functools.partial(_describe_nat_gateways, self.connection))
+        gateway = await batcher.request(self.id)
+        if gateway is None:
+            return
+        self.mob = gateway
+        self._tags = gateway.get('Tags', [])
+
     async def pre_create_hook(self):
         # Note this hook is also called in delete to populate
         # self.link; if that becomes inappropriate, then split
@@ -883,18 +1398,21 @@ class AwsNatGateway(carthage.machine.NetworkedModel, AwsManaged, InjectableModel
             extras['AllocationId'] = self.link.vpc_address_allocation
         if self.link.merged_v4_config.address:
             extras['PrivateIpAddress'] = str(self.link.merged_v4_config.address)
-        r = self.connection.client.create_nat_gateway(
+        r = self.create_idempotently(
+            self.connection.client.create_nat_gateway,
+            lambda r: r['NatGateway']['State'] in ('deleting', 'deleted'),
             ConnectivityType=self.connectivity_type,
             SubnetId=self.subnet.id,
             TagSpecifications=self.resource_tags(),
             **extras)
-        self.id = r['NatGateway']['NatGatewayId']
+        self.hydrate_created(r['NatGateway']['NatGatewayId'], r['NatGateway'])
+        self._tags = r['NatGateway'].get('Tags', [])
 
     async def post_find_hook(self):
         try:
             await wait_for_state_change(
                 self, lambda obj: obj.mob['State'],
-                'available', ['pending'], timeout=400)
+                'available', ['pending'], timeout=400, reload=AwsNatGateway.reload)
         finally:
             if self.mob['State'] == 'failed':
                 logger.error('%s failed: %s', self, self.mob["FailureMessage"])
@@ -904,6 +1422,7 @@ class AwsNatGateway(carthage.machine.NetworkedModel, AwsManaged, InjectableModel
                     raise RuntimeError(f'{self} failed: {self.mob["FailureMessage"]}')
 
     async def delete(self, delete_vpc_address=None):
+        self.connection.forget_created(self.id)
         def callback():
             self.connection.client.delete_nat_gateway(
                 NatGatewayId=self.id)
@@ -914,7 +1433,8 @@ class AwsNatGateway(carthage.machine.NetworkedModel, AwsManaged, InjectableModel
         await run_in_executor(callback)
         await wait_for_state_change(
             self, lambda obj: obj.mob['State'],
-            'deleted', ['available', 'pending', 'deleting', 'failed'], timeout=400)
+            'deleted', ['available', 'pending', 'deleting', 'failed'], timeout=400,
+            reload=AwsNatGateway.reload)
         if delete_vpc_address is None:
             await self.pre_create_hook()
             delete_vpc_address = not self.link.merged_v4_config.public_address
@@ -936,3 +1456,81 @@ class AwsNatGateway(carthage.machine.NetworkedModel, AwsManaged, InjectableModel
         return results
 
 __all__ += ['AwsNatGateway']
+
+def _describe_nat_gateways(connection, ids):
+    # Executor context; callback for the describe_nat_gateways batcher.
+    # A filter rather than NatGatewayIds so that one missing gateway
+    # does not fail the whole batch.
+    results = {}
+    paginator = connection.client.get_paginator('describe_nat_gateways')
+    for page in paginator.paginate(Filter=[{'Name': 'nat-gateway-id', 'Values': ids}]):
+        for g in page['NatGateways']:
+            results[g['NatGatewayId']] = g
+    return results
+
+async def _nat_gateways_for_vpc(vpc):
+    results = await vpc.ainjector.filter_instantiate_async(
+        None,
+        lambda k: isinstance(k.target, type) and issubclass(k.target, AwsNatGateway),
+        ready=False,
+        stop_at=vpc.ainjector)
+    # A gateway may be reachable under more than one key
+    return list({id(g): g for _, g in results}.values())
+
+async def _gather_all(coroutines):
+    # Like gather, but let every operation finish before raising the first failure.
+    results = await asyncio.gather(*coroutines, return_exceptions=True)
+    failures = [r for r in results if isinstance(r, BaseException)]
+    for f in failures[1:]:
+        logger.error('Additional failure: %s', f)
+    if failures:
+        raise failures[0]
+    return results
+
+@inject(ainjector=AsyncInjector)
+async def provision_nat_gateways(gateways=None, *, ainjector):
+    '''
+    Find or create a set of :class:`AwsNatGateway` concurrently.  If
+    *gateways* is not supplied, all the NAT gateways within the
+    :class:`AwsVirtualPrivateCloud` in *ainjector* are used.
+
+    Provisioning is pipelined:
+
+    #. Elastic IPs for all public gateways are found or allocated at once.
+
+    #. All gateways are then created together.  While they become
+       available, their state is tracked with one
+       ``describe_nat_gateways`` call per poll interval rather than
+       one per gateway.
+
+    So a VPC with a NAT gateway in each of six availability zones
+    takes about as long as creating one gateway.
+
+    '''
+    if gateways is None:
+        vpc = await ainjector.get_instance_async(AwsVirtualPrivateCloud)
+        gateways = await _nat_gateways_for_vpc(vpc)
+
+    async def allocate_address(gw):
+        if gw.connectivity_type == 'public' and InjectionKey(VpcAddress) in gw.injector:
+            await gw.ainjector.get_instance_async(VpcAddress)
+
+    await _gather_all(allocate_address(gw) for gw in gateways)
+    await _gather_all(gw.async_become_ready() for gw in gateways)
+    return gateways
+
+__all__ += ['provision_nat_gateways']
+
+@inject(ainjector=AsyncInjector)
+async def destroy_nat_gateways(gateways=None, *, ainjector):
+    '''
+    Delete a set of :class:`AwsNatGateway` (and the addresses they
+    allocated) concurrently, sharing state polls among them.
+    *gateways* defaults as in :func:`provision_nat_gateways`.
+    '''
+    if gateways is None:
+        vpc = await ainjector.get_instance_async(InjectionKey(AwsVirtualPrivateCloud, _ready=False))
+        gateways = await _nat_gateways_for_vpc(vpc)
+    await _gather_all(gw.delete() for gw in gateways)
+
+__all__ += ['destroy_nat_gateways']
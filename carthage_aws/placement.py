@@ -0,0 +1,299 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+import functools
+
+from botocore.exceptions import ClientError
+
+from carthage import *
+from carthage.modeling import *
+from carthage.dependency_injection import *
+from .connection import AwsManaged, run_in_executor
+
+__all__ = []
+
+class AwsPlacementGroup(AwsManaged, InjectableModel):
+
+    '''
+    An EC2 placement group.  Instances select a group with
+    ``aws_placement_group``, which may be an :class:`AwsPlacementGroup`
+    or the name of one (modeled or existing), and optionally a
+    partition with ``aws_placement_partition``.
+
+    :param strategy: ``cluster``, ``spread`` or ``partition``.
+
+    :param partition_count: The number of partitions for the partition strategy.
+
+    :param spread_level: ``rack`` or ``host`` for the spread strategy.
+    '''
+
+    stamp_type = 'placement_group'
+    resource_type = 'placement_group'
+    resource_factory_method = NotImplemented
+
+    strategy = 'cluster'
+    partition_count: int = None
+    spread_level: str = None
+
+    def __init__(self, **kwargs):
+        for k in ('strategy', 'partition_count', 'spread_level'):
+            if k in kwargs:
+                setattr(self, k, kwargs.pop(k))
+        super().__init__(**kwargs)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.name:
+            provides(InjectionKey(AwsPlacementGroup, name=cls.name))(cls)
+
+    def find_from_id(self):
+        try:
+            r = self.connection.client.describe_placement_groups(GroupIds=[self.id])
+            groups = [g for g in r['PlacementGroups'] if g['State'] not in ('deleting', 'deleted')]
+        except ClientError:
+            groups = []
+        self.mob = groups[0] if groups else self.connection.recently_created_data(self.id)
+        return self.mob
+
+    async def possible_ids_for_name(self):
+        ids = await super().possible_ids_for_name()
+        if ids:
+            return ids
+        def callback():
+            r = self.connection.client.describe_placement_groups(
+                Filters=[{'Name': 'group-name', 'Values': [self.name]}])
+            return [g['GroupId'] for g in r['PlacementGroups']]
+        return await run_in_executor(callback)
+
+    def current_resource_tags(self):
+        if self.mob is None:
+            return None
+        return {t['Key']: t['Value'] for t in self.mob.get('Tags', [])}
+
+    def do_create(self):
+        extra = {}
+        if self.partition_count:
+            extra['PartitionCount'] = self.partition_count
+        if self.spread_level:
+            extra['SpreadLevel'] = self.spread_level
+        r = self.connection.client.create_placement_group(
+            GroupName=self.name,
+            Strategy=self.strategy,
+            TagSpecifications=self.resource_tags(),
+            **extra)
+        self.hydrate_created(r['PlacementGroup']['GroupId'], r['PlacementGroup'])
+
+    def placement(self, partition=None):
+        '''
+        The Placement parameter for run_instances.
+
+        :param partition: The partition number, from 1 to *partition_count*.
+
+        :raises ValueError: if *partition* is given for a group not using the partition strategy, or is out of range.
+        '''
+        result = {'GroupId': self.id}
+        if partition is None:
+            return result
+        # The group may be an existing one found by name
+        mob = self.mob or {}
+        strategy = mob.get('Strategy', self.strategy)
+        partition_count = mob.get('PartitionCount', self.partition_count)
+        if strategy != 'partition':
+            raise ValueError(f'{self} uses the {strategy} strategy; partitions require the partition strategy')
+        if partition_count and not 1 <= partition <= partition_count:
+            raise ValueError(f'{self} has partitions 1 to {partition_count}, not {partition}')
+        result['PartitionNumber'] = partition
+        return result
+
+    async def delete(self):
+        self.connection.forget_created(self.id)
+        await run_in_executor(functools.partial(
+            self.connection.client.delete_placement_group, GroupName=self.mob['GroupName']))
+
+__all__ += ['AwsPlacementGroup']
+
+@inject(ainjector=AsyncInjector)
+async def find_placement_group(*, ainjector, ready=True):
+    '''
+    The :class:`AwsPlacementGroup` from ``aws_placement_group``.  A
+    name without a modeled group is returned as a string naming an
+    existing group.  None if no group is configured.
+    '''
+    group = await ainjector.get_instance_async(
+        InjectionKey('aws_placement_group', _optional=True, _ready=ready))
+    if isinstance(group, str):
+        modeled = await ainjector.get_instance_async(
+            InjectionKey(AwsPlacementGroup, name=group, _optional=True, _ready=ready))
+        if modeled is not None:
+            group = modeled
+    return group
+
+__all__ += ['find_placement_group']
+
+class AwsCapacityReservation(AwsManaged, InjectableModel):
+
+    '''
+    An On-Demand Capacity Reservation.  Instances select reservations
+    with ``aws_capacity_reservation``; see
+    :meth:`~.vm.AwsVm.resolve_capacity_reservations`.
+
+    :param instance_type: The instance type to reserve.
+
+    :param availability_zone: The zone of the reservation; instances
+        using it must be in a subnet in this zone.
+
+    :param instance_count: The number of instances to reserve.
+        Changed in place on existing reservations.
+
+    :param instance_match_criteria: ``targeted`` to be used only by
+        instances naming the reservation, or ``open`` to be used by
+        any matching instance.
+    '''
+
+    stamp_type = 'capacity_reservation'
+    resource_type = 'capacity_reservation'
+    resource_factory_method = NotImplemented
+
+    instance_type: str = None
+    availability_zone: str = None
+    instance_count: int = 1
+    instance_platform = 'Linux/UNIX'
+    instance_match_criteria = 'targeted'
+
+    def __init__(self, **kwargs):
+        for k in ('instance_type', 'availability_zone', 'instance_count',
+                  'instance_platform', 'instance_match_criteria'):
+            if k in kwargs:
+                setattr(self, k, kwargs.pop(k))
+        super().__init__(**kwargs)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.name:
+            provides(InjectionKey(AwsCapacityReservation, name=cls.name))(cls)
+
+    def find_from_id(self):
+        try:
+            r = self.connection.client.describe_capacity_reservations(CapacityReservationIds=[self.id])
+            reservations = [c for c in r['CapacityReservations'] if c['State'] in ('active', 'pending')]
+        except ClientError:
+            reservations = []
+        self.mob = reservations[0] if reservations else self.connection.recently_created_data(self.id)
+        return self.mob
+
+    async def possible_ids_for_name(self):
+        ids = await super().possible_ids_for_name()
+        if ids:
+            return ids
+        def callback():
+            r = self.connection.client.describe_capacity_reservations(Filters=[
+                {'Name': 'tag:Name', 'Values': [self.name]},
+                {'Name': 'state', 'Values': ['active', 'pending']},
+            ])
+            return [c['CapacityReservationId'] for c in r['CapacityReservations']]
+        return await run_in_executor(callback)
+
+    def current_resource_tags(self):
+        if self.mob is None:
+            return None
+        return {t['Key']: t['Value'] for t in self.mob.get('Tags', [])}
+
+    def do_create(self):
+        if not (self.instance_type and self.availability_zone):
+            raise ValueError(f'{self} requires instance_type and availability_zone')
+        r = self.create_idempotently(
+            self.connection.client.create_capacity_reservation, _reservation_stale,
+            InstanceType=self.instance_type,
+            InstancePlatform=self.instance_platform,
+            AvailabilityZone=self.availability_zone,
+            InstanceCount=self.instance_count,
+            InstanceMatchCriteria=self.instance_match_criteria,
+            TagSpecifications=self.resource_tags())
+        self.hydrate_created(r['CapacityReservation']['CapacityReservationId'], r['CapacityReservation'])
+
+    async def read_write_hook(self):
+        if self.mob['TotalInstanceCount'] == self.instance_count:
+            return
+        logger.info('Changing %s from %d to %d instances', self, self.mob['TotalInstanceCount'], self.instance_count)
+        await run_in_executor(functools.partial(
+            self.connection.client.modify_capacity_reservation,
+            CapacityReservationId=self.id, InstanceCount=self.instance_count))
+        self.mob['TotalInstanceCount'] = self.instance_count
+
+    def specification(self):
+        '''The CapacityReservationSpecification parameter for run_instances.'''
+        return {'CapacityReservationTarget': {'CapacityReservationId': self.id}}
+
+    async def delete(self):
+        self.connection.forget_created(self.id)
+        await run_in_executor(functools.partial(
+            self.connection.client.cancel_capacity_reservation, CapacityReservationId=self.id))
+
+__all__ += ['AwsCapacityReservation']
+
+@inject(ainjector=AsyncInjector)
+async def capacity_reservation_objects(*, ainjector, ready=True):
+    '''
+    The items of ``aws_capacity_reservation``, which may be a single
+    item or a list, with names of modeled reservations replaced by
+    their :class:`AwsCapacityReservation`.
+    '''
+    items = await ainjector.get_instance_async(
+        InjectionKey('aws_capacity_reservation', _optional=True, _ready=ready))
+    if items is None:
+        return []
+    if isinstance(items, (str, AwsCapacityReservation)):
+        items = [items]
+    results = []
+    for item in items:
+        if isinstance(item, str) and item not in ('open', 'none') and not item.startswith(('cr-', 'arn:')):
+            item = await ainjector.get_instance_async(
+                InjectionKey(AwsCapacityReservation, name=item, _ready=ready))
+        results.append(item)
+    return results
+
+__all__ += ['capacity_reservation_objects']
+
+def _reservation_stale(response):
+    # A client token reused from a reservation since cancelled or expired
+    return response['CapacityReservation']['State'] not in ('active', 'pending')
+
+async def capacity_reservation_specifications(items, zones=()):
+    '''
+    Return the CapacityReservationSpecification for each of *items*:
+    an :class:`AwsCapacityReservation`, a reservation id, the ARN of
+    a reservation group, or ``open`` or ``none`` for the
+    corresponding CapacityReservationPreference.  Ending the list
+    with ``open`` falls back to On-Demand capacity.
+
+    The subnet fixes an instance's availability zone, so
+    reservations outside *zones* (if given) are skipped.  Modeled
+    reservations are made ready first.
+
+    :raises ValueError: if every item is skipped.
+    '''
+    results = []
+    for item in items:
+        if isinstance(item, AwsCapacityReservation):
+            await item.async_become_ready()
+            zone = item.mob['AvailabilityZone']
+            if zones and zone not in zones:
+                logger.warning('Skipping %s in %s', item, zone)
+                continue
+            results.append(item.specification())
+        elif item in ('open', 'none'):
+            results.append({'CapacityReservationPreference': item})
+        elif item.startswith('arn:'):
+            results.append({'CapacityReservationTarget': {'CapacityReservationResourceGroupArn': item}})
+        else:
+            results.append({'CapacityReservationTarget': {'CapacityReservationId': item}})
+    if items and not results:
+        raise ValueError(f'No capacity reservation in {", ".join(sorted(zones))}')
+    return results
+
+__all__ += ['capacity_reservation_specifications']
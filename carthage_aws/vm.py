@@ -5,8 +5,14 @@
 # WITHOUT ANY WARRANTY; without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
 # LICENSE for details.
+# pylint: disable=too-many-lines
 import asyncio
+import base64
 import contextlib
+import functools
+import gzip
+import hashlib
+import secrets
 import warnings
 
 from ipaddress import IPv4Address
@@ -22,10 +28,62 @@ from carthage.network import NetworkLink
 from carthage.local import LocalMachineMixin
 from carthage.cloud_init import generate_cloud_init_cloud_config
 
-from .connection import AwsConnection, AwsManaged, run_in_executor
+from .connection import AwsConnection, AwsManaged, run_in_executor, create_with_client_token
+from .launch_template import launch_template_for, _content_hash
+from .placement import (
+    AwsPlacementGroup, AwsCapacityReservation,
+    find_placement_group, capacity_reservation_objects, capacity_reservation_specifications,
+)
+from .instance_options import (
+    interface_options, validate_network_options,
+    performance_keys, performance_options, reconcile_performance_options,
+)
 
 __all__ = ['AwsVm']
 
+#: run_instances errors after which the next capacity reservation candidate is tried
+capacity_error_codes = frozenset({'InsufficientInstanceCapacity', 'ReservationCapacityExceeded'})
+
+#: EC2 limit on the size of user data before base64 encoding
+user_data_limit = 16384
+
+def render_cloud_config(connection, user_data):
+    '''
+    Render *user_data* (the dict from a cloud-init cloud config) as a
+    ``#cloud-config`` document.  Documents are cached per connection
+    by content hash so that identical VMs render once.
+    '''
+    key = ('cloud-config', _content_hash(user_data))
+    try:
+        return connection.user_data_documents[key]
+    except KeyError:
+        pass
+    document = "#cloud-config\n"
+    document += yaml.dump(user_data, default_flow_style=False)
+    connection.user_data_documents[key] = document
+    return document
+
+__all__ += ['render_cloud_config']
+
+def compress_user_data(connection, document):
+    '''
+    Return *document* gzip compressed, which cloud-init detects and
+    decompresses.  The output is deterministic so that identical
+    launches can still be coalesced.
+    '''
+    if isinstance(document, str):
+        document = document.encode('utf-8')
+    key = ('gzip', hashlib.sha256(document).hexdigest())
+    try:
+        return connection.user_data_documents[key]
+    except KeyError:
+        pass
+    payload = gzip.compress(document, mtime=0)
+    connection.user_data_documents[key] = payload
+    return payload
+
+__all__ += ['compress_user_data']
+
 @inject(
     connection=AwsConnection,
     ami=InjectionKey('aws_ami'),
@@ -35,13 +93,12 @@ __all__ = ['AwsVm']
 async def generate_block_device_mappings(connection, ami, model, volume_type):
     if volume_type is None:
         volume_type ='gp2'
-    services =         connection .connection.resource('ec2', region_name=connection.region)
-    ami_image = services.Image(ami)
+    ami_image = await connection.image_metadata(ami)
     mappings = []
     disk_sizes = model.disk_sizes
     disk_name = '/dev/xvda'
     i = 0
-    for i, mapping in enumerate(ami_image.block_device_mappings):
+    for i, mapping in enumerate(ami_image['BlockDeviceMappings']):
         if i >= len(disk_sizes):
             break
         if 'Ebs' not in mapping:
@@ -70,9 +127,27 @@ async def generate_block_device_mappings(connection, ami, model, volume_type):
         })
     return mappings
 
+async def encrypt_root_volume(connection, ami, mappings):
+    '''
+    Return *mappings* with the root volume of *ami* encrypted, as
+    hibernation requires.
+    '''
+    root_device = (await connection.image_metadata(ami))['RootDeviceName']
+    mappings = [dict(m) for m in mappings or []]
+    for m in mappings:
+        if m['DeviceName'] == root_device:
+            m['Ebs'] = {**m.get('Ebs', {}), 'Encrypted': True}
+            return mappings
+    mappings.insert(0, {'DeviceName': root_device, 'Ebs': {'Encrypted': True}})
+    return mappings
 
-@inject(ainjector=AsyncInjector)
-async def find_security_groups(l:NetworkLink,  *, ainjector):
+def desired_security_groups(l:NetworkLink):
+    '''
+    The names of the security groups for *l*: its
+    *aws_security_groups*, else its network's, else
+    ``aws_security_groups`` in the network's injector, else
+    ``default``.
+    '''
     desired_groups = getattr(l, 'aws_security_groups', None)
     if desired_groups is None:
         desired_groups = getattr(l.net, 'aws_security_groups', None)
@@ -86,14 +161,35 @@ async def find_security_groups(l:NetworkLink,  *, ainjector):
             f"`{desired_groups}` is not a valid value for desired_groups. "
             "It must be an iterable of strings and not of type str."
         )
-
-    groups = {g['GroupName']:g['GroupId'] for g in l.net_instance.vpc.groups}
-    results = []
     for g in desired_groups:
         assert isinstance(g, str), f"Items in desired_groups must be a string. Got {g!r} instead."
-        g_obj = await l.net.ainjector.get_instance_async(InjectionKey(AwsSecurityGroup, name=g, _optional=True))
+    return list(desired_groups)
+
+@inject(ainjector=AsyncInjector)
+async def security_group_objects(l:NetworkLink, *, ainjector, ready=True):
+    '''
+    Map each of :func:`desired_security_groups` to the
+    :class:`AwsSecurityGroup` providing it, looked up first in the
+    network's injector and then in *ainjector*.  Groups that are not
+    modeled (for example existing groups like ``default``) map to
+    None.
+    '''
+    results = {}
+    for g in desired_security_groups(l):
+        g_obj = await l.net.ainjector.get_instance_async(
+            InjectionKey(AwsSecurityGroup, name=g, _optional=True, _ready=ready))
         if not g_obj:
-            g_obj = await ainjector.get_instance_async(InjectionKey(AwsSecurityGroup, name=g, _optional=True))
+            g_obj = await ainjector.get_instance_async(
+                InjectionKey(AwsSecurityGroup, name=g, _optional=True, _ready=ready))
+        results[g] = g_obj
+    return results
+
+@inject(ainjector=AsyncInjector)
+async def find_security_groups(l:NetworkLink,  *, ainjector):
+    group_objects = await ainjector(security_group_objects, l)
+    groups = {g['GroupName']:g['GroupId'] for g in l.net_instance.vpc.groups}
+    results = []
+    for g, g_obj in group_objects.items():
         if g_obj:
             results.append(g_obj.id)
         elif g in groups:
@@ -126,9 +222,25 @@ class AwsVm(AwsManaged, Machine):
         self._operation_lock = asyncio.Lock()
         self._clear_ip_address = True
         self._user_data = None
+        #: Size in bytes of the user data sent to EC2
+        self.user_data_size = None
         self.image_id = None
         self.iam_profile = None
         self.block_device_mappings = None
+        self._warm_pool_task = None
+        self.launch_template = None
+        self.placement = None
+        #: The describe_instance_types entry for aws_instance_type, set by :meth:`pre_create_hook`
+        self.instance_type_info = None
+        #: CpuOptions, EbsOptimized and similar run_instances parameters; see :meth:`desired_performance_options`
+        self.performance_options = {}
+        #: CapacityReservationSpecification candidates tried in order; see :meth:`resolve_capacity_reservations`
+        self.capacity_reservations = []
+
+    #: Tag marking a stopped spare instance in the warm pool of the named VM
+    warm_pool_tag = 'carthage:warm_pool'
+    #: Tag holding a hash of the launch parameters of a warm pool spare
+    warm_pool_config_tag = 'carthage:warm_pool_config'
 
     async def user_data(self):
         '''
@@ -142,19 +254,99 @@ class AwsVm(AwsManaged, Machine):
             return getattr(self.model, 'aws_user_data', "")
         return ""
 
-    def _find_ip_address(self):
-        def async_cb():
-            for network_link in updated_private_links:
-                self.injector.emit_event(
-                    InjectionKey(NetworkLink),
-                    "address", network_link,
-                    addl_keys=[InjectionKey(NetworkLink, host=self.name)])
-            for network_link in updated_public_links:
-                self.injector.emit_event(
-                    InjectionKey(NetworkLink),
-                    "public_address", network_link,
-                    adl_keys=[InjectionKey(NetworkLink, host=self.name)])
+    def encode_user_data(self, user_data, is_cloud_init=False):
+        '''
+        Prepare *user_data* for run_instances.  If
+        ``aws_user_data_compression`` is true, or is unset and
+        *is_cloud_init* is true, the data is gzip compressed.
+
+        :raises ValueError: if the result exceeds the EC2 user data limit.
+        '''
+        if not user_data:
+            self.user_data_size = 0
+            return user_data
+        compression = self._gfi('aws_user_data_compression', default=None)
+        if compression is None:
+            compression = is_cloud_init
+        raw_size = len(user_data.encode('utf-8') if isinstance(user_data, str) else user_data)
+        payload = compress_user_data(self.connection, user_data) if compression else user_data
+        self.user_data_size = len(payload) if isinstance(payload, bytes) else raw_size
+        logger.info('%s user data: %d bytes (%d uncompressed)', self.name, self.user_data_size, raw_size)
+        if self.user_data_size > user_data_limit:
+            raise ValueError(
+                f'User data for {self.name} is {self.user_data_size} bytes; '
+                f'EC2 allows at most {user_data_limit}')
+        return payload
+
+    async def describe_instance(self):
+        '''
+        Return the ``describe_instances`` entry for this instance, or
+        None if it does not exist.  Instances described at about the
+        same time share one call.
+        '''
+        batcher = self.connection.batcher(
+            'describe_instances',
+            functools.partial(_describe_instances, self.connection))
+        return await batcher.request(self.id)
+
+    async def change_instance_state(self, operation, **kwargs):
+        '''
+        Call *operation* (``start_instances``, ``stop_instances`` or
+        ``terminate_instances``) for this instance.  Concurrent calls with the same *kwargs*
+        share one multi-instance request.
 
+        :returns: The instance's new state name.
+        '''
+        batcher = self.connection.batcher(
+            (operation, tuple(sorted(kwargs.items()))),
+            functools.partial(_change_instance_states, self.connection, operation, kwargs))
+        result = await batcher.request(self.id)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def wait_for_instance_state(self, state, timeout=600):
+        '''
+        Poll until the instance reaches *state*.  Polls from
+        instances waiting at the same time are combined through
+        :meth:`describe_instance`.
+        '''
+        instance = await self.describe_instance()
+        while instance is None or instance['State']['Name'] != state:
+            if instance is None and state == 'terminated':
+                # Terminated instances eventually disappear
+                return None
+            if instance and instance['State']['Name'] == 'terminated':
+                raise RuntimeError(f'{self} terminated while waiting for {state}')
+            if timeout <= 0:
+                raise TimeoutError(f'{self} did not reach {state}')
+            await asyncio.sleep(5)
+            timeout -= 5
+            instance = await self.describe_instance()
+        self._hydrate(instance)
+        return instance
+
+    def _hydrate(self, instance):
+        # Update mob from a describe_instances entry without another request
+        if self.mob is None:
+            self.mob = self.service_resource.Instance(self.id)
+        self.mob.meta.data = instance
+
+    async def _wait_until_running(self, timeout):
+        # The describe_instances entry once the instance leaves
+        # pending.  A just-launched instance may not be visible yet.
+        instance = await self.describe_instance()
+        while instance is None or instance['State']['Name'] == 'pending':
+            if timeout <= 0:
+                raise RuntimeError(f'{self} did not leave the pending state')
+            await asyncio.sleep(5)
+            timeout -= 5
+            instance = await self.describe_instance()
+        if instance['State']['Name'] != 'running':
+            raise RuntimeError(f'{self} is {instance["State"]["Name"]} rather than running')
+        return instance
+
+    async def _find_ip_address(self, timeout=600):
         updated_public_links = []
         updated_private_links = []
         update_ip_address = False
@@ -165,17 +357,18 @@ class AwsVm(AwsManaged, Machine):
             except NotImplementedError:
                 update_ip_address = True
 
-        self.mob.wait_until_running()
-        self.mob.reload()
+        instance = await self._wait_until_running(timeout)
+        self._hydrate(instance)
         local_network_links = filter(lambda l: not l.local_type, self.network_links.values())
-        for network_link, interface in zip(local_network_links, self.mob.network_interfaces):
-            if network_link.net_instance.mob != interface.subnet:
+        interfaces = sorted(instance['NetworkInterfaces'], key=lambda i: i['Attachment']['DeviceIndex'])
+        for network_link, interface in zip(local_network_links, interfaces):
+            if network_link.net_instance.id != interface['SubnetId']:
                 logger.warning(
                     'Instance %s: network links do not match instance interface for %s',
                     self.id, network_link.interface
                 )
                 continue
-            private_address = IPv4Address(interface.private_ip_address)
+            private_address = IPv4Address(interface['PrivateIpAddress'])
             if private_address != network_link.merged_v4_config.address:
                 network_link.merged_v4_config.address = private_address
                 if update_ip_address and self.aws_ip_address_is_private:
@@ -183,10 +376,8 @@ class AwsVm(AwsManaged, Machine):
                     self.ssh_recompute()
                     self._clear_ip_address = True
                 updated_private_links.append(network_link)
-            if not interface.association_attribute:
-                continue
-            association = interface.association_attribute
-            if not ('PublicIp' in association and association['PublicIp']):
+            association = interface.get('Association')
+            if not (association and association.get('PublicIp')):
                 continue
             address = IPv4Address(association['PublicIp'])
             if address != network_link.merged_v4_config.public_address:
@@ -196,9 +387,10 @@ class AwsVm(AwsManaged, Machine):
                         '%s associating elastic IP for %s',
                         self.id, network_link.merged_v4_config.public_address
                     )
-                    self.connection.client.associate_address(
+                    await run_in_executor(functools.partial(
+                        self.connection.client.associate_address,
                         AllocationId=network_link.vpc_address_allocation,
-                        NetworkInterfaceId=interface.id)
+                        NetworkInterfaceId=interface['NetworkInterfaceId']))
                 else:
                     # public_v4_address being updated from association
                     network_link.merged_v4_config.public_address = address
@@ -208,7 +400,7 @@ class AwsVm(AwsManaged, Machine):
                 self.ssh_recompute()
                 self._clear_ip_address = True
         if updated_public_links or updated_private_links:
-            self.ainjector.loop.call_soon_threadsafe(async_cb)
+            _queue_link_events(self, updated_private_links, updated_public_links)
 
     async def find(self):
         await self.resolve_networking()
@@ -224,30 +416,111 @@ class AwsVm(AwsManaged, Machine):
 
     async def pre_create_hook(self):
         # operation lock is held by overriding find_or_create
-        if getattr(self.model, 'cloud_init', False):
+        await self.start_dependencies()
+        await super().start_machine()
+        await self.resolve_launch_configuration()
+        await self.assign_private_addresses()
+        for l in self.network_links.values():
+            if not l.local_type and l.merged_v4_config.public_address:
+                from .network import aws_link_handle_eip
+                await aws_link_handle_eip(self, l)
+        validate_network_options(self.instance_type_info, self.network_links.values())
+        if self._gfi('aws_launch_template', default=False):
+            self.launch_template = await launch_template_for(self.ainjector, self.launch_template_data())
+
+    async def resolve_launch_configuration(self):
+        '''
+        Resolve the user data, image, security groups and other
+        settings used by :meth:`launch_template_data`.  Called by
+        :meth:`pre_create_hook`, and by
+        :class:`~.autoscaling.AwsAutoScalingGroup` for the machine
+        serving as its template, which is never itself created.
+        '''
+        is_cloud_init = getattr(self.model, 'cloud_init', False)
+        if is_cloud_init:
             cloud_config = await self.ainjector(generate_cloud_init_cloud_config, model=self.model)
-            user_data = "#cloud-config\n"
-            user_data += yaml.dump(cloud_config.user_data, default_flow_style=False)
-            self._user_data = user_data
+            user_data = render_cloud_config(self.connection, cloud_config.user_data)
             if self.ssh_online_command == Machine.ssh_online_command:
                 self.ssh_online_command = 'systemctl --wait is-system-running'
         else:
-            self._user_data = await self.user_data()
+            user_data = await self.user_data()
+        self._user_data = self.encode_user_data(user_data, is_cloud_init=is_cloud_init)
         self.image_id = await self.ainjector.get_instance_async('aws_ami')
         self.iam_profile = await self.ainjector.get_instance_async(InjectionKey("aws_iam_profile", _optional=True))
-        await self.start_dependencies()
-        await super().start_machine()
         if hasattr(self.model, 'disk_sizes'):
             self.block_device_mappings = await self.ainjector(generate_block_device_mappings)
         else: self.block_device_mappings = None
+        if self._gfi('aws_hibernate', default=False):
+            self.block_device_mappings = await encrypt_root_volume(
+                self.connection, self.image_id, self.block_device_mappings)
+        self.placement = await self.resolve_placement()
+        self.capacity_reservations = await self.resolve_capacity_reservations()
         for l in self.network_links.values():
-            if l.local_type:
-                continue
-            l.security_group_ids = await self.ainjector(find_security_groups, l)
-            if l.merged_v4_config.public_address:
-                from .network import aws_link_handle_eip
-                await aws_link_handle_eip(self, l)
+            if not l.local_type:
+                l.security_group_ids = await self.ainjector(find_security_groups, l)
+        self.instance_type_info = await self.connection.instance_type_info(self._gfi('aws_instance_type'))
+        self.performance_options = self.desired_performance_options()
+
+    def encoded_user_data(self):
+        '''The user data base64 encoded, as launch template data requires.'''
+        if not self._user_data:
+            return None
+        payload = self._user_data
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        return base64.b64encode(payload).decode('ascii')
+
+    async def resolve_placement(self):
+        '''The Placement parameter for run_instances, or None.'''
+        group = await self.ainjector(find_placement_group)
+        if group is None:
+            return None
+        partition = self._gfi('aws_placement_partition', default=None)
+        if isinstance(group, str):
+            placement = {'GroupName': group}
+            if partition is not None:
+                placement['PartitionNumber'] = partition
+            return placement
+        return group.placement(partition)
+
+    async def resolve_capacity_reservations(self):
+        '''
+        The CapacityReservationSpecification candidates from
+        ``aws_capacity_reservation``; see
+        :func:`~.placement.capacity_reservation_specifications`.  If
+        run_instances fails for lack of capacity, :meth:`do_create`
+        tries the next candidate.
+        '''
+        zones = {l.net_instance.mob.availability_zone
+                 for l in self.network_links.values() if not l.local_type}
+        return await capacity_reservation_specifications(await self.ainjector(capacity_reservation_objects), zones)
 
+    async def assign_private_addresses(self):
+        '''
+        Check each fixed private address against its subnet's
+        :class:`~.network.SubnetAddressIndex`.  If
+        ``aws_allocate_private_addresses`` is true, links without an
+        address are assigned one from the index, so the address is
+        known before launch.
+
+        :raises ValueError: if an address cannot be assigned in its subnet.
+        '''
+        allocate = self._gfi('aws_allocate_private_addresses', default=False)
+        for l in self.network_links.values():
+            if l.local_type or not (l.merged_v4_config.address or allocate):
+                continue
+            index = await l.net_instance.address_index()
+            address = l.merged_v4_config.address
+            if address is None:
+                l.merged_v4_config.address = index.allocate()
+                logger.debug('%s: allocated %s for %s', self.name, l.merged_v4_config.address, l.interface)
+                continue
+            if address not in index:
+                raise ValueError(
+                    f'{address} is not an assignable address in {index.network} for host {self.name}')
+            if index.is_used(address):
+                logger.warning('%s: %s is already in use in %s', self.name, address, index.network)
+            index.mark_used(address)
 
     @setup_task("Create VM", order=AwsManaged.find_or_create.order)
     async def find_or_create(self, already_locked=False):
@@ -259,7 +532,8 @@ class AwsVm(AwsManaged, Machine):
     find_or_create.check_completed_func = AwsManaged.find_or_create.check_completed_func
 
 
-    def do_create(self):
+    def network_interfaces(self):
+        '''The NetworkInterfaces parameter for run_instances.'''
         network_interfaces = []
         device_index = 0
         for l in self.network_links.values():
@@ -271,44 +545,130 @@ class AwsVm(AwsManaged, Machine):
                 'SubnetId': l.net_instance.id,
             }
             if l.merged_v4_config.address:
-                assert l.merged_v4_config.address in l.net.v4_config.network.hosts(), (
-                    f"{l.merged_v4_config.address} is not a hostaddr in "
-                    f"{l.net.v4_config.network} for host {self.name}"
-                )
+                # Validated against the subnet by assign_private_addresses
                 d['PrivateIpAddress'] = l.merged_v4_config.address.compressed
             if len(self.network_links) == 1 or l.merged_v4_config.public_address:
                 d['AssociatePublicIpAddress'] = not l.merged_v4_config.public_address is False
             if hasattr(l, 'security_group_ids'):
                 d['Groups'] = l.security_group_ids
+            d.update(interface_options(l))
             network_interfaces.append(d)
             device_index += 1
+        return network_interfaces
 
+    def launch_template_data(self):
+        '''
+        The launch parameters shared by every instance of this
+        configuration: everything except user data, tags and fixed
+        private addresses.  Used as ``LaunchTemplateData`` when
+        ``aws_launch_template`` is set.
+        '''
+        data = {
+            'ImageId': self.image_id,
+            'InstanceType': self._gfi('aws_instance_type'),
+        }
+        key_name = self._gfi('aws_key_name', default=None)
+        if key_name:
+            data['KeyName'] = key_name
+        if self.block_device_mappings:
+            data['BlockDeviceMappings'] = self.block_device_mappings
+        if self.iam_profile:
+            data['IamInstanceProfile'] = {"Name":self.iam_profile}
+        if self._gfi('aws_hibernate', default=False):
+            data['HibernationOptions'] = {'Configured': True}
+        if self.placement:
+            data['Placement'] = self.placement
+        data.update(self.performance_options)
+        network_interfaces = self.network_interfaces()
+        if not any('PrivateIpAddress' in i for i in network_interfaces):
+            data['NetworkInterfaces'] = network_interfaces
+        return data
+
+    def launch_parameters(self):
+        '''
+        Return the parameters for run_instances other than *MinCount* and *MaxCount*.
+        Run in executor context after :meth:`pre_create_hook`.
+
+        If :attr:`launch_template` is set, only the parameters not in
+        the template are included.
+        '''
+        if self.launch_template:
+            parameters = {'LaunchTemplate': self.launch_template.specification()}
+            if 'NetworkInterfaces' not in self.launch_template.template_data:
+                parameters['NetworkInterfaces'] = self.network_interfaces()
+        else:
+            parameters = self.launch_template_data()
+            parameters['NetworkInterfaces'] = self.network_interfaces()
+        if self.capacity_reservations:
+            parameters['CapacityReservationSpecification'] = self.capacity_reservations[0]
+        parameters['UserData'] = self._user_data
+        parameters['TagSpecifications'] = self.resource_tags()
+        return parameters
+
+    def do_create(self):
+        launch_parameters = self.launch_parameters()
         logger.info('Starting %s VM', self.name)
 
+        candidates = self.capacity_reservations or [None]
+        for i, specification in enumerate(candidates):
+            if specification:
+                launch_parameters['CapacityReservationSpecification'] = specification
+            try:
+                r = self.create_idempotently(
+                    self.connection.client.run_instances, _instances_stale,
+                    MinCount=1,
+                    MaxCount=1,
+                    **launch_parameters
+                )
+                self.hydrate_created(r['Instances'][0]['InstanceId'], r['Instances'][0])
+                return True
+            except ClientError as e:
+                if e.response['Error']['Code'] in capacity_error_codes and i+1 < len(candidates):
+                    logger.warning('%s: %s; trying %s', self.name, e.response['Error']['Code'], candidates[i+1])
+                    continue
+                logger.error('Could not create AWS VM for %s because %s.', self.model.name, e)
+                return False
+
+    async def create_resource(self):
+        '''
+        If ``aws_warm_pool_size`` is set, claim a stopped spare from the
+        warm pool if one launched with the same parameters is
+        available, and replenish the pool in the background.  If the pool is empty, as on the first deploy, it
+        is filled only after this instance has been launched.
+
+        If ``aws_coalesce_launches`` is true, launch together with other
+        VMs whose launch parameters are identical apart from the Name
+        tag; see :func:`launch_coalesced`.  Otherwise launch
+        individually.
+        '''
+        warm_pool = self._gfi('aws_warm_pool_size', default=0)
+        if not (warm_pool or self._gfi('aws_coalesce_launches', default=False)):
+            return await super().create_resource()
+        launch_parameters = await run_in_executor(self.launch_parameters)
+        if any('PrivateIpAddress' in i for i in launch_parameters.get('NetworkInterfaces', [])):
+            # Neither spares nor a multi-count launch can have this instance's fixed address
+            return await super().create_resource()
+        if warm_pool:
+            self.id = await run_in_executor(
+                _claim_warm_spare, self.connection, self.name, self.warm_pool_tag,
+                self.warm_pool_config_tag, _content_hash(launch_parameters))
+            if self.id:
+                logger.info('%s claimed warm pool instance %s', self.name, self.id)
+                self.schedule_warm_pool_replenish(launch_parameters)
+                await self.change_instance_state('start_instances')
+                return
+            if not self._gfi('aws_coalesce_launches', default=False):
+                result = await super().create_resource()
+                if self.id:
+                    self.schedule_warm_pool_replenish(launch_parameters)
+                return result
+        window = self._gfi('aws_launch_coalesce_window', default=0.5)
         try:
-            extra = {}
-            key_name = self._gfi('aws_key_name', default=None)
-            if key_name:
-                extra['KeyName'] = key_name
-            if self.block_device_mappings:
-                extra['BlockDeviceMappings'] = self.block_device_mappings
-            if self.iam_profile:
-                extra['IamInstanceProfile'] = {"Name":self.iam_profile}
-            r = self.connection.client.run_instances(
-                ImageId=self.image_id,
-                MinCount=1,
-                MaxCount=1,
-                InstanceType=self._gfi('aws_instance_type'),
-                UserData=self._user_data,
-                NetworkInterfaces=network_interfaces,
-                TagSpecifications=self.resource_tags(),
-                **extra
-            )
-            self.id = r['Instances'][0]['InstanceId']
-            return True
+            self.id = await launch_coalesced(self.connection, self.name, launch_parameters, window=window)
         except ClientError as e:
             logger.error('Could not create AWS VM for %s because %s.', self.model.name, e)
-            return False
+        if warm_pool and self.id:
+            self.schedule_warm_pool_replenish(launch_parameters)
 
     def find_from_id(self):
         # terminated instances do not count
@@ -324,17 +684,55 @@ class AwsVm(AwsManaged, Machine):
                 # so we cannot access the state.
                 self.mob = None
                 return
+
+    def desired_performance_options(self):
+        '''
+        The run_instances parameters from the
+        :data:`~.instance_options.performance_keys` injection keys,
+        validated against :attr:`instance_type_info`; see
+        :func:`~.instance_options.performance_options`.
+        '''
+        settings = {k: self._gfi(k, default=None) for k in performance_keys}
+        return performance_options(self.instance_type_info, settings)
+
+    async def read_write_hook(self):
+        if not self.mob:
+            return
+        if self.instance_type_info is None:
+            if all(self._gfi(k, default=None) is None for k in performance_keys):
+                return
+            instance_type = self._gfi('aws_instance_type', default=None) or self.mob.instance_type
+            self.instance_type_info = await self.connection.instance_type_info(instance_type)
+            self.performance_options = self.desired_performance_options()
+        if not self.performance_options:
+            return
+        pending = await run_in_executor(
+            reconcile_performance_options, self.connection.client, self.mob, self.performance_options)
+        if pending:
+            logger.warning('%s: %s cannot change while the instance is running; stop it and redeploy to apply',
+                           self.name, ', '.join(pending))
+
     async def post_find_hook(self):
         await self.is_machine_running()
         return await super().post_find_hook()
 
     async def dynamic_dependencies(self):
         result =  await Machine.dynamic_dependencies(self)
-        # In addition to the AwsSubnets, we need to depend on any
-        # security group we use.  It turns out calculating that is
-        # harder than I want to spend time on, so as a stop-gap depend
-        # on all security groups.
-        result.extend(self.injector.filter(AwsSecurityGroup, ['name']))
+        # In addition to the AwsSubnets, depend on the security
+        # groups our links use.
+        for l in self.network_links.values():
+            if l.local_type:
+                continue
+            group_objects = await self.ainjector(security_group_objects, l, ready=False)
+            for g_obj in group_objects.values():
+                if g_obj and g_obj not in result:
+                    result.append(g_obj)
+        placement_group = await self.ainjector(find_placement_group, ready=False)
+        if isinstance(placement_group, AwsPlacementGroup):
+            result.append(placement_group)
+        for reservation in await self.ainjector(capacity_reservation_objects, ready=False):
+            if isinstance(reservation, AwsCapacityReservation):
+                result.append(reservation)
         return result
 
 
@@ -353,19 +751,26 @@ class AwsVm(AwsManaged, Machine):
                 if self.running:
                     return
             logger.info('Starting %s', self.name)
-            await run_in_executor(self.mob.start)
-            await run_in_executor(self.mob.wait_until_running)
+            await self.change_instance_state('start_instances')
+            await self.wait_for_instance_state('running')
             await self.is_machine_running()
             return True
 
 
-    async def stop_machine(self):
+    async def stop_machine(self, hibernate=None):
+        '''
+        :param hibernate: Hibernate rather than shut down.  Defaults
+        to ``aws_hibernate``, which must have been set when the
+        instance was launched.
+        '''
+        if hibernate is None:
+            hibernate = self._gfi('aws_hibernate', default=False)
         async with self._operation_lock:
             if not self.running:
                 return
-            logger.info('Stopping %s', self.name)
-            await run_in_executor(self.mob.stop)
-            await run_in_executor(self.mob.wait_until_stopped)
+            logger.info('%s %s', 'Hibernating' if hibernate else 'Stopping', self.name)
+            await self.change_instance_state('stop_instances', **({'Hibernate': True} if hibernate else {}))
+            await self.wait_for_instance_state('stopped')
             if self._clear_ip_address:
                 try:
                     del self.ip_address
@@ -382,16 +787,119 @@ class AwsVm(AwsManaged, Machine):
             return False
         self.running = self.mob.state['Name'] in ('pending', 'running')
         if self.running:
-            # This needs to happen in a thread which has an asyncio
-            # loop rather than in a executor thread.
-            self.ssh_jump_host # pylint: disable=pointless-statement
-            self.aws_ip_address_is_private # pylint: disable=pointless-statement
-            await run_in_executor(self._find_ip_address)
+            await self._find_ip_address()
         return self.running
 
     async def delete(self):
-        await run_in_executor(self.mob.terminate)
-        await run_in_executor(self.mob.wait_until_terminated)
+        self.connection.forget_created(self.id)
+        await self.change_instance_state('terminate_instances')
+        await self.wait_for_instance_state('terminated')
+        if self._gfi('aws_warm_pool_size', default=0):
+            await self.delete_warm_pool()
+
+    async def replenish_warm_pool(self, launch_parameters):
+        '''
+        Launch spares until ``aws_warm_pool_size`` instances with
+        *launch_parameters* are in the warm pool for this VM.  Spares
+        are named :attr:`warm_spare_name` so that they appear in the
+        inventory; they are not orphans (see
+        :meth:`owned_resource_ids`).  Once their status checks pass
+        they are stopped, hibernating if they were launched with
+        hibernation configured (``aws_hibernate``), so that claiming
+        one skips boot and cloud-init.
+
+        Spares are tagged with a hash of *launch_parameters*
+        (:attr:`warm_pool_config_tag`); only matching spares are
+        claimed, and spares launched with other parameters are
+        terminated here.
+        '''
+        size = self._gfi('aws_warm_pool_size', default=0)
+        config = _content_hash(launch_parameters)
+        spares = await run_in_executor(_warm_spares, self.connection, self.name, self.warm_pool_tag)
+        stale = [i['InstanceId'] for i in spares if _tag_value(i, self.warm_pool_config_tag) != config]
+        if stale:
+            logger.info('Terminating %d outdated warm pool instances for %s', len(stale), self.name)
+            await run_in_executor(functools.partial(
+                self.connection.client.terminate_instances, InstanceIds=stale))
+        needed = size - (len(spares) - len(stale))
+        if needed <= 0:
+            return
+        launch_parameters = dict(launch_parameters)
+        launch_parameters['TagSpecifications'] = [
+            {**spec, 'Tags': spec['Tags']+[
+                {'Key': 'Name', 'Value': self.warm_spare_name},
+                {'Key': self.warm_pool_tag, 'Value': self.name},
+                {'Key': self.warm_pool_config_tag, 'Value': config}]}
+            for spec in _strip_name_tags(launch_parameters['TagSpecifications'])]
+        logger.info('Launching %d warm pool instances for %s', needed, self.name)
+        # Retries of this request are idempotent, but each
+        # replenishment needs its own token to launch new spares.
+        r = await run_in_executor(functools.partial(
+            self.connection.client.run_instances,
+            ClientToken=secrets.token_hex(16),
+            MinCount=needed, MaxCount=needed,
+            **launch_parameters))
+        ids = [i['InstanceId'] for i in r['Instances']]
+        for instance in r['Instances']:
+            self.connection.remember_created(instance['InstanceId'], instance)
+        await self.wait_for_status_ok(ids)
+        hibernate = all(i.get('HibernationOptions', {}).get('Configured') for i in r['Instances'])
+        await run_in_executor(functools.partial(
+            self.connection.client.stop_instances, InstanceIds=ids, **({'Hibernate': True} if hibernate else {})))
+
+    async def wait_for_status_ok(self, ids, timeout=900):
+        '''
+        Poll until the status checks of the instances *ids* pass.
+        Polls from all VMs using the connection are combined into one
+        ``describe_instance_status`` call.
+        '''
+        batcher = self.connection.batcher(
+            'describe_instance_status',
+            functools.partial(_describe_instance_status, self.connection))
+        pending = list(ids)
+        while True:
+            statuses = await asyncio.gather(*(batcher.request(i) for i in pending))
+            pending = [i for i, status in zip(pending, statuses) if status != 'ok']
+            if not pending:
+                return
+            if timeout <= 0:
+                raise TimeoutError(f'Status checks for {", ".join(pending)} did not pass')
+            await asyncio.sleep(15)
+            timeout -= 15
+
+    @property
+    def warm_spare_name(self):
+        '''The Name of unclaimed spares in this VM's warm pool.'''
+        return f'{self.name} warm spare'
+
+    def owned_resource_ids(self):
+        # Unclaimed warm pool spares, and the launch template the
+        # instance was launched from
+        results = list(self.connection.names_by_resource_type.get('instance', {}).get(self.warm_spare_name, ()))
+        if self.mob:
+            results.extend(t['Value'] for t in self.mob.tags or [] if t['Key'] == 'aws:ec2launchtemplate:id')
+        return results
+
+    def schedule_warm_pool_replenish(self, launch_parameters):
+        '''Replenish the warm pool in the background unless already doing so.'''
+        if self._warm_pool_task and not self._warm_pool_task.done():
+            return
+        def done(task):
+            if not task.cancelled() and task.exception():
+                logger.error('Failed to replenish warm pool for %s: %s', self.name, task.exception())
+        self._warm_pool_task = asyncio.ensure_future(self.replenish_warm_pool(launch_parameters))
+        self._warm_pool_task.add_done_callback(done)
+
+    async def delete_warm_pool(self):
+        '''Terminate any spares in this VM's warm pool.'''
+        if self._warm_pool_task:
+            self._warm_pool_task.cancel()
+        spares = await run_in_executor(_warm_spares, self.connection, self.name, self.warm_pool_tag)
+        if spares:
+            logger.info('Terminating %d warm pool instances for %s', len(spares), self.name)
+            await run_in_executor(functools.partial(
+                self.connection.client.terminate_instances,
+                InstanceIds=[i['InstanceId'] for i in spares]))
 
     async def root_device_and_volume(self):
         ''':returns: tuple of root device and volume'''
@@ -409,6 +917,164 @@ class AwsVm(AwsManaged, Machine):
     resource_type = 'instance'
     resource_factory_method = 'Instance'
 
+def _describe_instances(connection, ids):
+    # Executor context; callback for the describe_instances batcher.
+    # A filter rather than InstanceIds so that one missing instance
+    # does not fail the whole batch.
+    results = {}
+    paginator = connection.client.get_paginator('describe_instances')
+    for page in paginator.paginate(Filters=[{'Name': 'instance-id', 'Values': ids}]):
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                results[instance['InstanceId']] = instance
+    return results
+
+_instance_state_changes = {
+    'start_instances': 'StartingInstances',
+    'stop_instances': 'StoppingInstances',
+    'terminate_instances': 'TerminatingInstances',
+}
+
+def _describe_instance_status(connection, ids):
+    # Executor context; callback for the describe_instance_status batcher
+    try:
+        r = connection.client.describe_instance_status(InstanceIds=ids, IncludeAllInstances=True)
+    except ClientError:
+        # Not yet visible after launch; poll again
+        return {}
+    return {s['InstanceId']: s['InstanceStatus']['Status'] for s in r['InstanceStatuses']}
+
+def _change_instance_states(connection, operation, kwargs, ids):
+    # Executor context; callback for the start_instances,
+    # stop_instances and terminate_instances batchers.  Maps each id to its new state, or to
+    # the error if that instance could not change state.
+    try:
+        r = getattr(connection.client, operation)(InstanceIds=ids, **kwargs)
+    except ClientError as e:
+        if len(ids) == 1:
+            return {ids[0]: e}
+        # One bad instance fails the whole request; retry individually
+        results = {}
+        for i in ids:
+            results.update(_change_instance_states(connection, operation, kwargs, [i]))
+        return results
+    changes = r[_instance_state_changes[operation]]
+    return {c['InstanceId']: c['CurrentState']['Name'] for c in changes}
+
+def _warm_spares(connection, pool, tag):
+    # Executor context; instances in the warm pool for *pool*
+    paginator = connection.client.get_paginator('describe_instances')
+    results = []
+    for page in paginator.paginate(Filters=[
+            {'Name': f'tag:{tag}', 'Values': [pool]},
+            {'Name': 'instance-state-name', 'Values': ['pending', 'running', 'stopping', 'stopped']},
+    ]):
+        for reservation in page['Reservations']:
+            results.extend(reservation['Instances'])
+    return results
+
+def _tag_value(instance, key):
+    for t in instance.get('Tags', []):
+        if t['Key'] == key:
+            return t['Value']
+    return None
+
+def _claim_warm_spare(connection, pool, tag, config_tag, config):
+    # Executor context; take a stopped spare launched with the
+    # parameters hashed as *config* out of the warm pool and give it
+    # the Name of the VM.  Returns the instance id or None.
+    for instance in _warm_spares(connection, pool, tag):
+        if instance['State']['Name'] != 'stopped' or _tag_value(instance, config_tag) != config:
+            continue
+        instance_id = instance['InstanceId']
+        connection.client.delete_tags(Resources=[instance_id], Tags=[{'Key': tag}, {'Key': config_tag}])
+        connection.client.create_tags(Resources=[instance_id], Tags=[{'Key': 'Name', 'Value': pool}])
+        return instance_id
+    return None
+
+def _emit_link_events(pending):
+    events = list(pending)
+    pending.clear()
+    for vm, private_links, public_links in events:
+        for network_link in private_links:
+            vm.injector.emit_event(
+                InjectionKey(NetworkLink),
+                "address", network_link,
+                adl_keys=[InjectionKey(NetworkLink, host=vm.name)])
+        for network_link in public_links:
+            vm.injector.emit_event(
+                InjectionKey(NetworkLink),
+                "public_address", network_link,
+                adl_keys=[InjectionKey(NetworkLink, host=vm.name)])
+
+def _queue_link_events(vm, private_links, public_links):
+    # Address discovery for a batch of instances completes in the
+    # same loop iteration; emit all of their events from one callback.
+    pending = vm.connection.pending_link_events
+    if not pending:
+        asyncio.get_event_loop().call_soon(_emit_link_events, pending)
+    pending.append((vm, private_links, public_links))
+
+def _strip_name_tags(tag_specifications):
+    return [
+        {**spec, 'Tags': [t for t in spec['Tags'] if t['Key'] != 'Name']}
+        for spec in tag_specifications]
+
+def _instances_stale(response):
+    # A client token reused from instances since terminated
+    return any(i['State']['Name'] in ('shutting-down', 'terminated') for i in response['Instances'])
+
+#: Tag shared by the instances of one coalesced launch until they are named
+launch_group_tag = 'carthage:launch_group'
+
+def _run_instance_group(connection, launch_parameters, names):
+    # Executor context; callback for a launch batcher
+    logger.info('Launching %d instances together: %s', len(names), ', '.join(names))
+    token = _content_hash([connection.config_layout.layout_name, launch_parameters, names])
+    # Until it is named, an instance is found by the group tag
+    group = token[:32]
+    tag_specifications = [
+        {**spec, 'Tags': [*spec['Tags'], {'Key': launch_group_tag, 'Value': group}]}
+        if spec['ResourceType'] == 'instance' else spec
+        for spec in launch_parameters['TagSpecifications']]
+    r = create_with_client_token(
+        connection.client.run_instances, token, _instances_stale,
+        MinCount=len(names),
+        MaxCount=len(names),
+        **{**launch_parameters, 'TagSpecifications': tag_specifications})
+    results = dict(zip(names, (i['InstanceId'] for i in r['Instances'])))
+    by_name = {}
+    for name, instance_id in results.items():
+        by_name.setdefault(name, []).append(instance_id)
+    for name, instance_ids in by_name.items():
+        connection.client.create_tags(Resources=instance_ids, Tags=[{'Key': 'Name', 'Value': name}])
+    connection.client.delete_tags(Resources=list(results.values()), Tags=[{'Key': launch_group_tag}])
+    for instance in r['Instances']:
+        connection.remember_created(instance['InstanceId'], instance)
+    return results
+
+async def launch_coalesced(connection, name, launch_parameters, *, window=0.5):
+    '''
+    Launch an instance named *name* in one ``run_instances`` call
+    shared with every other launch whose *launch_parameters* are
+    identical apart from the Name tag and that is requested within
+    *window* seconds.  The instances in the group carry a shared
+    ``carthage:launch_group`` tag until they are named, so an
+    instance whose naming failed can still be found.
+
+    :returns: The instance id.
+    '''
+    launch_parameters = dict(launch_parameters)
+    launch_parameters['TagSpecifications'] = _strip_name_tags(launch_parameters['TagSpecifications'])
+    signature = _content_hash(launch_parameters)
+    batcher = connection.batcher(
+        ('run_instances', signature),
+        functools.partial(_run_instance_group, connection, launch_parameters),
+        delay=window, max_batch=100)
+    return await batcher.request(name)
+
+__all__ += ['launch_coalesced']
+
 @inject()
 class  LocalAwsVm(LocalMachineMixin, AwsVm):
     pass
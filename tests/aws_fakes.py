@@ -0,0 +1,77 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+'''
+Stand-ins for boto3 clients and :class:`~carthage_aws.AwsConnection`
+used by the tests that do not need AWS.
+'''
+
+import asyncio
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+from carthage import base_injector
+from carthage_aws.connection import AwsConnection
+
+class FakeClient:
+
+    '''
+    A boto3 client recording each call in :attr:`calls` as
+    ``(operation, kwargs)``.
+
+    The response to an operation comes from *responses*: a callable
+    given the call's keyword arguments, or a value.  Operations without
+    a response return ``{}``.  Paginators return the operation's
+    response as a single page.
+    '''
+
+    def __init__(self, **responses):
+        self.responses = responses
+        self.calls = []
+
+    def __getattr__(self, operation):
+        if operation.startswith('_'):
+            raise AttributeError(operation)
+        def call(**kwargs):
+            self.calls.append((operation, kwargs))
+            response = self.responses.get(operation, {})
+            return response(**kwargs) if callable(response) else response
+        return call
+
+    def get_paginator(self, operation):
+        return SimpleNamespace(paginate=lambda **kwargs: [getattr(self, operation)(**kwargs)])
+
+    def operations(self):
+        '''The names of the operations called, in order.'''
+        return [operation for operation, _ in self.calls]
+
+    def kwargs(self, operation):
+        '''The keyword arguments of each call to *operation*.'''
+        return [kwargs for o, kwargs in self.calls if o == operation]
+
+def client_error(code, operation='Operation'):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+def fake_connection(client=None, *, layout_name='test', cache_dir=None, **config):
+    '''
+    A real :class:`AwsConnection` that is never connected, using
+    *client* (a :class:`FakeClient` by default).  *config* overrides
+    the ``aws`` configuration.  Call outside the event loop.
+    '''
+    aws_config = {'eip_reserve': 0, 'image_cache_ttl': 0, **config}
+    async def create():
+        # Injectables emit events, which need an event loop
+        return AwsConnection(
+            injector=base_injector,
+            config_layout=SimpleNamespace(
+                aws=SimpleNamespace(**aws_config), layout_name=layout_name, cache_dir=cache_dir))
+    connection = asyncio.run(create())
+    connection.client = client if client is not None else FakeClient()
+    connection.region = 'us-east-1'
+    return connection
@@ -1,5 +1,6 @@
 pytest_plugins = ('carthage.pytest_plugin',)
 
+import asyncio
 import logging
 import pytest
 import carthage.ssh
@@ -41,3 +42,9 @@ async def cleanup(ainjector):
             await aws_image.delete()
     except (LookupError, NotImplementedError):
         pass
+
+@pytest.fixture()
+def fast_sleep(monkeypatch):
+    '''Make asyncio.sleep yield without waiting so polling loops run instantly.'''
+    sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, 'sleep', lambda delay: sleep(0))
@@ -155,6 +155,29 @@ class test_layout(CarthageLayout, PublicDnsManagement, AnsibleModelMixin):
         egress_rules = []
 
 
+    class partner_prefixes(AwsManagedPrefixList):
+        name = 'partner_prefixes'
+        entries = ['10.10.0.0/24', ('10.10.1.0/24', 'second partner')]
+        max_entries = 5
+
+    class prefix_list_access(AwsSecurityGroup):
+        name = 'prefix_list_access'
+        ingress_rules = [SgRule(
+            port=22,
+            prefix_list=InjectionKey(AwsManagedPrefixList, name='partner_prefixes'))]
+
+    class spread_group(AwsPlacementGroup):
+        name = 'spread_group'
+        strategy = 'spread'
+
+    class workers(AwsAutoScalingGroup):
+        name = 'workers'
+        max_size = 2
+        desired_capacity = 1
+
+        class worker(MachineModel):
+            aws_instance_type = 't3.micro'
+
     class ip_1(VpcAddress):
         name = 'address_1'
 
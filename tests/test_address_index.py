@@ -0,0 +1,36 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+from ipaddress import IPv4Address
+
+import pytest
+
+from carthage_aws.network import SubnetAddressIndex
+
+def test_aws_reserved_addresses_excluded():
+    index = SubnetAddressIndex('10.0.0.0/16')
+    assert '10.0.0.3' not in index
+    assert '10.0.0.4' in index
+    assert '10.0.255.254' in index
+    assert '10.0.255.255' not in index
+    assert '10.1.0.4' not in index
+    index.mark_used('10.0.0.1')
+    with pytest.raises(ValueError):
+        index.is_used('10.0.0.1')
+
+def test_allocate_skips_used_addresses():
+    index = SubnetAddressIndex('10.0.0.0/28')
+    for i in range(4, 12):
+        index.mark_used(f'10.0.0.{i}')
+    assert index.allocate() == IPv4Address('10.0.0.12')
+    index.release('10.0.0.5')
+    assert index.allocate() == IPv4Address('10.0.0.5')
+    assert index.allocate() == IPv4Address('10.0.0.13')
+    assert index.allocate() == IPv4Address('10.0.0.14')
+    with pytest.raises(LookupError):
+        index.allocate()
@@ -0,0 +1,64 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+import asyncio
+import itertools
+
+import pytest
+from botocore.exceptions import ClientError
+
+from aws_fakes import FakeClient, client_error, fake_connection
+from carthage_aws.connection import AwsConnection
+
+reserve_tag = AwsConnection.address_reserve_tag
+
+def allocator():
+    numbers = itertools.count(1)
+    def allocate_address(**kwargs):
+        assert kwargs['Domain'] == 'vpc'
+        n = next(numbers)
+        return {'PublicIp': f'192.0.2.{n}', 'AllocationId': f'eipalloc-{n}', 'Domain': 'vpc'}
+    return allocate_address
+
+def test_replenish_address_reserve():
+    connection = fake_connection(FakeClient(allocate_address=allocator()), eip_reserve=3)
+    connection.remember_address({
+        'PublicIp': '198.51.100.1', 'AllocationId': 'eipalloc-used', 'AssociationId': 'eipassoc-1',
+        'Tags': [{'Key': reserve_tag, 'Value': 'available'}]})
+    asyncio.run(connection.replenish_address_reserve())
+    allocations = connection.client.kwargs('allocate_address')
+    assert len(allocations) == 3
+    assert allocations[0]['TagSpecifications'][0]['Tags'] == [{'Key': reserve_tag, 'Value': 'available'}]
+    assert len(connection.reserved_addresses()) == 3
+    # A full reserve allocates nothing
+    asyncio.run(connection.replenish_address_reserve())
+    assert len(connection.client.kwargs('allocate_address')) == 3
+
+def test_claim_reserved_address():
+    connection = fake_connection(FakeClient(allocate_address=allocator()), eip_reserve=2)
+    asyncio.run(connection.replenish_address_reserve())
+    tags = [{'Key': 'Name', 'Value': 'gateway'}]
+    address = connection.claim_reserved_address(tags)
+    assert address['Tags'] == tags
+    assert connection.client.kwargs('delete_tags') == [
+        {'Resources': [address['AllocationId']], 'Tags': [{'Key': reserve_tag}]}]
+    assert connection.client.kwargs('create_tags') == [{'Resources': [address['AllocationId']], 'Tags': tags}]
+    assert address not in connection.reserved_addresses()
+    assert connection.claim_reserved_address(tags) is not None
+    assert connection.claim_reserved_address(tags) is None
+
+def test_claim_failure_untags_cached_address():
+    def create_tags(**kwargs):
+        raise client_error('RequestLimitExceeded', 'CreateTags')
+    connection = fake_connection(FakeClient(allocate_address=allocator(), create_tags=create_tags), eip_reserve=1)
+    asyncio.run(connection.replenish_address_reserve())
+    with pytest.raises(ClientError):
+        connection.claim_reserved_address([{'Key': 'Name', 'Value': 'gateway'}])
+    # The reserve tag was removed in AWS, so the address is no longer reserved
+    assert not connection.reserved_addresses()
+    assert not connection._claiming_addresses # pylint: disable=protected-access
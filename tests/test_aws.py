@@ -151,6 +151,45 @@ async def test_security_groups(carthage_layout):
     finally:
         await layout.no_access.delete()
 
+@async_test
+async def test_prefix_list(carthage_layout):
+    layout = carthage_layout
+    await layout.ainjector.get_instance_async(AwsConnection)
+    try:
+        await layout.prefix_list_access.async_become_ready()
+        await layout.partner_prefixes.async_become_ready()
+        assert set(layout.partner_prefixes.current_entries) == {'10.10.0.0/24', '10.10.1.0/24'}
+        assert any(p.get('PrefixListIds') for p in layout.prefix_list_access.mob.ip_permissions)
+    finally:
+        await layout.prefix_list_access.delete()
+        await layout.partner_prefixes.delete()
+
+@async_test
+async def test_placement_group(carthage_layout):
+    layout = carthage_layout
+    await layout.ainjector.get_instance_async(AwsConnection)
+    try:
+        await layout.spread_group.async_become_ready()
+        assert layout.spread_group.mob['Strategy'] == 'spread'
+        found = await layout.ainjector.get_instance_async(InjectionKey(AwsPlacementGroup, name='spread_group'))
+        assert found is layout.spread_group
+    finally:
+        await layout.spread_group.delete()
+
+@async_test
+async def test_auto_scaling_group(carthage_layout):
+    layout = carthage_layout
+    await layout.ainjector.get_instance_async(AwsConnection)
+    try:
+        await layout.workers.async_become_ready()
+        assert layout.workers.mob['DesiredCapacity'] == 1
+        assert layout.workers.mob['LaunchTemplate']['LaunchTemplateId'] == layout.workers.launch_template.id
+        layout.workers.desired_capacity = 2
+        await layout.workers.read_write_hook()
+        assert layout.workers.mob['DesiredCapacity'] == 2
+    finally:
+        await layout.workers.delete()
+
 @async_test
 async def test_elastic_ip(carthage_layout):
     layout = carthage_layout
@@ -0,0 +1,95 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+import asyncio
+
+from carthage import base_injector
+from carthage.dependency_injection import Injector
+from carthage.deployment import DeletionPolicy, DryRun, destroy_policy, orphan_policy
+
+import carthage_aws.connection
+from carthage_aws.connection import AwsManaged, bulk_destroy, delete_orphans
+
+class FakeDeployable(AwsManaged):
+
+    '''
+    An :class:`AwsManaged` of resource type *kind* recording when it
+    is deleted.  *policies* maps policy keys to values.  Construct
+    within the event loop.
+    '''
+
+    resource_type = property(lambda self: self.kind)
+
+    def __init__(self, kind, events, policies=None, readonly=False, exists=True):
+        injector = base_injector(Injector)
+        for key, value in (policies or {}).items():
+            injector.add_provider(key, value)
+        super().__init__(injector=injector, connection=None, config_layout=None)
+        self.kind = kind
+        self.events = events
+        self.readonly = readonly
+        self.exists = exists
+
+    async def find(self):
+        self.mob = {'State': 'available'} if self.exists else None
+
+    async def delete(self):
+        self.events.append(('delete', self.kind))
+        await asyncio.sleep(0)
+        self.events.append(('deleted', self.kind))
+
+    def __repr__(self):
+        return f'<FakeDeployable {self.kind}>'
+
+def deleted(events):
+    return [kind for event, kind in events if event == 'delete']
+
+def test_bulk_destroy_tiers():
+    events = []
+    async def destroy():
+        deployables = [FakeDeployable(kind, events) for kind in ('vpc', 'subnet', 'other', 'volume', 'instance')]
+        deployables.append(FakeDeployable('instance', events, exists=False))
+        return await bulk_destroy(deployables)
+    assert asyncio.run(destroy()) == []
+    # Each tier finishes before the next starts; unknown types go last
+    assert events == [
+        ('delete', 'instance'), ('deleted', 'instance'),
+        ('delete', 'volume'), ('deleted', 'volume'),
+        ('delete', 'subnet'), ('deleted', 'subnet'),
+        ('delete', 'vpc'), ('deleted', 'vpc'),
+        ('delete', 'other'), ('deleted', 'other')]
+
+def test_bulk_destroy_policy():
+    events = []
+    async def destroy():
+        deployables = [
+            FakeDeployable('instance', events, {destroy_policy: DeletionPolicy.retain}),
+            FakeDeployable('volume', events, {destroy_policy: DeletionPolicy.warn}),
+            FakeDeployable('snapshot', events, {destroy_policy: DeletionPolicy.delete}),
+            FakeDeployable('vpc', events, {orphan_policy: DeletionPolicy.retain}),
+            FakeDeployable('image', events, readonly=True),
+            'not an AWS object',
+        ]
+        await bulk_destroy(deployables)
+        assert deleted(events) == ['snapshot', 'vpc']
+        # Orphans are deleted according to orphan_policy
+        events.clear()
+        await bulk_destroy(deployables, policy=orphan_policy)
+        assert deleted(events) == ['instance', 'volume', 'snapshot']
+    asyncio.run(destroy())
+
+def test_delete_orphans(monkeypatch):
+    events = []
+    async def find_orphan_deployables():
+        return [FakeDeployable('vpc', events, readonly=DryRun), FakeDeployable('instance', events, readonly=DryRun),
+                FakeDeployable('volume', events, {orphan_policy: DeletionPolicy.retain}, readonly=DryRun)]
+    monkeypatch.setattr(carthage_aws.connection, 'find_orphan_deployables', find_orphan_deployables)
+    async def ainjector(f):
+        return await f()
+    assert asyncio.run(delete_orphans(ainjector=ainjector)) == []
+    assert deleted(events) == ['instance', 'vpc']
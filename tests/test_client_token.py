@@ -0,0 +1,51 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+from types import SimpleNamespace
+
+from carthage_aws.connection import AwsManaged, create_with_client_token
+
+def resource(layout_name='layout', name='vpc'):
+    return SimpleNamespace(
+        config_layout=SimpleNamespace(layout_name=layout_name),
+        resource_type='vpc', name=name)
+
+def test_client_token():
+    token = AwsManaged.client_token(resource(), {'CidrBlock': '10.0.0.0/16'})
+    assert token == AwsManaged.client_token(resource(), {'CidrBlock': '10.0.0.0/16'})
+    assert len(token) <= 64  # The EC2 limit
+    assert token != AwsManaged.client_token(resource(), {'CidrBlock': '10.1.0.0/16'})
+    assert token != AwsManaged.client_token(resource(name='other'), {'CidrBlock': '10.0.0.0/16'})
+    assert token != AwsManaged.client_token(resource(layout_name='other'), {'CidrBlock': '10.0.0.0/16'})
+
+class FakeCreate:
+
+    '''Returns a deleted resource for tokens in *stale_tokens*.'''
+
+    def __init__(self, stale_tokens=()):
+        self.stale_tokens = set(stale_tokens)
+        self.tokens = []
+
+    def __call__(self, ClientToken, **parameters):
+        self.tokens.append(ClientToken)
+        return {'State': 'deleted' if ClientToken in self.stale_tokens else 'available', **parameters}
+
+def stale(response):
+    return response['State'] == 'deleted'
+
+def test_create_with_client_token():
+    create = FakeCreate()
+    assert create_with_client_token(create, 'token', stale, Size=1) == {'State': 'available', 'Size': 1}
+    assert create.tokens == ['token']
+
+def test_create_with_stale_client_token():
+    create = FakeCreate(['token'])
+    assert create_with_client_token(create, 'token', stale, Size=1) == {'State': 'available', 'Size': 1}
+    assert create.tokens[0] == 'token'
+    assert len(create.tokens) == 2 and create.tokens[1] != 'token'
+    assert len(create.tokens[1]) <= 64
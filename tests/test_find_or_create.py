@@ -0,0 +1,80 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+# pylint: disable=protected-access
+
+import asyncio
+import time
+
+from carthage import base_injector
+from carthage.dependency_injection import Injector
+
+from aws_fakes import fake_connection
+from carthage_aws.connection import AwsManaged
+
+class FakeResource(AwsManaged):
+
+    '''An :class:`AwsManaged` counting finds; it exists once any object with its name has created it.'''
+
+    resource_type = 'fake_resource'
+    stamp_type = 'fake_resource'
+
+    def __init__(self, connection, existing, **kwargs):
+        super().__init__(
+            injector=base_injector(Injector), connection=connection,
+            config_layout=connection.config_layout, readonly=False, **kwargs)
+        self.existing = existing
+        self.finds = 0
+
+    async def find(self):
+        self.finds += 1
+        if self.name in self.existing:
+            self.id = self.existing[self.name]
+            self.mob = {'Id': self.id}
+
+    def do_create(self):
+        self.id = self.existing[self.name] = f'fake-{len(self.existing)}'
+        self.mob = {'Id': self.id}
+
+def find_or_create(connection, existing, *names, missed_at=None):
+    '''
+    Create a :class:`FakeResource` for each of *names* and run
+    :meth:`~AwsManaged.find_or_create` on each in turn, as if their
+    completion checks failed to find them *missed_at* seconds ago.
+    '''
+    async def run():
+        resources = [FakeResource(connection, existing, name=name) for name in names]
+        for r in resources:
+            if missed_at is not None:
+                r._find_missed_at = time.monotonic() - missed_at
+        for r in resources:
+            await r.find_or_create()
+        return resources
+    return asyncio.run(run())
+
+def test_find_miss_trusted():
+    connection = fake_connection()
+    existing = {}
+    # No recent miss: find runs
+    r, = find_or_create(connection, existing, 'a')
+    assert r.finds == 1 and r.id == 'fake-0'
+    # A recent miss is trusted
+    r, = find_or_create(connection, existing, 'b', missed_at=1)
+    assert r.finds == 0 and r.id == 'fake-1'
+    # An expired miss is not
+    r, = find_or_create(connection, existing, 'c', missed_at=FakeResource.negative_find_ttl+1)
+    assert r.finds == 1 and r.id == 'fake-2'
+
+def test_find_miss_invalidated_by_create():
+    connection = fake_connection()
+    existing = {}
+    # Both missed; the second must find what the first created
+    # rather than create it again.
+    first, second = find_or_create(connection, existing, 'a', 'a', missed_at=1)
+    assert (first.finds, second.finds) == (0, 1)
+    assert first.id == second.id == 'fake-0'
+    assert list(existing) == ['a']
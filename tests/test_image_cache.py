@@ -0,0 +1,70 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+import asyncio
+import datetime
+
+from aws_fakes import FakeClient, fake_connection
+from carthage_aws.image import find_images, _forget_cached_images, _image_cache
+
+created = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+
+def image_connection(tmp_path, images, ttl=3600):
+    return fake_connection(
+        FakeClient(describe_images={'Images': images}),
+        cache_dir=str(tmp_path), image_cache_ttl=ttl)
+
+def owners(connection):
+    '''The owner searched by each describe_images call.'''
+    return [kwargs['Owners'][0] for kwargs in connection.client.kwargs('describe_images')]
+
+def lookup(connection, owner, name='debian-*'):
+    return asyncio.run(find_images(connection, name=name, owner=owner))
+
+def test_image_cache(tmp_path):
+    _image_cache.clear()
+    image = {'ImageId': 'ami-1', 'CreationDate': '2026-01-01T00:00:00.000Z'}
+    expected = [dict(image, CreationDate=created)]
+    connection = image_connection(tmp_path, [image])
+    assert lookup(connection, '136693071363') == expected
+    assert lookup(connection, '136693071363') == expected
+    # Owned images are never cached
+    lookup(connection, 'self')
+    lookup(connection, 'self')
+    assert owners(connection) == ['136693071363', 'self', 'self']
+    # A newly registered image invalidates matching lookups
+    _forget_cached_images(connection.config_layout, 'us-east-1', 'debian-13')
+    lookup(connection, '136693071363')
+    assert owners(connection) == ['136693071363', 'self', 'self', '136693071363']
+    _image_cache.clear()
+
+def test_image_cache_skips_empty_and_disabled(tmp_path):
+    _image_cache.clear()
+    connection = image_connection(tmp_path, [])
+    assert not lookup(connection, '136693071363')
+    assert not lookup(connection, '136693071363')
+    assert len(owners(connection)) == 2
+    connection = image_connection(tmp_path, [{'ImageId': 'ami-1', 'CreationDate': '2026-01-01T00:00:00Z'}], ttl=0)
+    lookup(connection, '136693071363')
+    lookup(connection, '136693071363')
+    assert len(owners(connection)) == 2
+    assert not _image_cache
+
+def test_image_cache_creation_date(tmp_path):
+    _image_cache.clear()
+    older = {'ImageId': 'ami-1', 'CreationDate': '2025-06-01T00:00:00.000Z'}
+    newer = {'ImageId': 'ami-2', 'CreationDate': created}
+    connection = image_connection(tmp_path, [older, newer])
+    uncached = lookup(connection, '136693071363')
+    assert [i['ImageId'] for i in uncached] == ['ami-2', 'ami-1']
+    assert all(isinstance(i['CreationDate'], datetime.datetime) for i in uncached)
+    # Entries read back from the cache file have the same types
+    _image_cache.clear()
+    assert lookup(connection, '136693071363') == uncached
+    assert len(owners(connection)) == 1
+    _image_cache.clear()
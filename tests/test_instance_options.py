@@ -0,0 +1,102 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+from types import SimpleNamespace
+
+import pytest
+
+from aws_fakes import FakeClient
+from carthage_aws.instance_options import (
+    interface_options, validate_network_options,
+    performance_options, reconcile_performance_options,
+)
+
+def link(interface, interface_type=None, ena_express=False):
+    return SimpleNamespace(
+        interface=interface, local_type=None,
+        aws_interface_type=interface_type, aws_ena_express=ena_express,
+        net=SimpleNamespace(aws_interface_type='interface', aws_ena_express=False))
+
+def instance_type(**network_info):
+    return {
+        'InstanceType': 'test.large',
+        'NetworkInfo': {'MaximumNetworkInterfaces': 2, **network_info},
+    }
+
+def test_interface_options():
+    assert not interface_options(link('eth0'))
+    assert interface_options(link('eth0', 'efa', 'udp')) == {
+        'InterfaceType': 'efa',
+        'EnaSrdSpecification': {
+            'EnaSrdEnabled': True,
+            'EnaSrdUdpSpecification': {'EnaSrdUdpEnabled': True},
+        },
+    }
+
+def test_validate_network_options():
+    validate_network_options(instance_type(), [link('eth0'), link('eth1')])
+    with pytest.raises(ValueError):
+        validate_network_options(instance_type(), [link('eth0'), link('eth1'), link('eth2')])
+    with pytest.raises(ValueError):
+        validate_network_options(instance_type(), [link('eth0', 'efa')])
+    validate_network_options(
+        instance_type(EfaSupported=True, EfaInfo={'MaximumEfaInterfaces': 1}),
+        [link('eth0', 'efa')])
+    with pytest.raises(ValueError):
+        validate_network_options(
+            instance_type(EfaSupported=True, EfaInfo={'MaximumEfaInterfaces': 1}),
+            [link('eth0', 'efa'), link('eth1', 'efa-only')])
+    with pytest.raises(ValueError):
+        validate_network_options(instance_type(), [link('eth0', ena_express=True)])
+    validate_network_options(instance_type(EnaSrdSupported=True), [link('eth0', ena_express=True)])
+
+def test_performance_options():
+    info = {
+        'InstanceType': 't3.large',
+        'VCpuInfo': {'DefaultCores': 1, 'DefaultThreadsPerCore': 2, 'ValidCores': [1], 'ValidThreadsPerCore': [1, 2]},
+        'EbsInfo': {'EbsOptimizedSupport': 'default'},
+        'BurstablePerformanceSupported': True,
+    }
+    assert not performance_options(info, {})
+    assert performance_options(info, {
+        'aws_threads_per_core': 1,
+        'aws_cpu_credits': 'unlimited',
+        'aws_metadata_tokens': 'required',
+    }) == {
+        'CpuOptions': {'CoreCount': 1, 'ThreadsPerCore': 1},
+        'CreditSpecification': {'CpuCredits': 'unlimited'},
+        'MetadataOptions': {'HttpTokens': 'required'},
+    }
+    with pytest.raises(ValueError):
+        performance_options(info, {'aws_cpu_cores': 2})
+    with pytest.raises(ValueError):
+        performance_options(info, {'aws_ebs_optimized': False})
+    with pytest.raises(ValueError):
+        performance_options(info, {'aws_metadata_hop_limit': 0})
+    with pytest.raises(ValueError):
+        performance_options({**info, 'BurstablePerformanceSupported': False}, {'aws_cpu_credits': 'standard'})
+
+def test_reconcile_stopped_only_options():
+    options = {
+        'CpuOptions': {'CoreCount': 2, 'ThreadsPerCore': 1},
+        'EbsOptimized': True,
+        'MetadataOptions': {'HttpPutResponseHopLimit': 2},
+    }
+    instance = SimpleNamespace(
+        id='i-1', state={'Name': 'running'}, ebs_optimized=False,
+        cpu_options={'CoreCount': 2, 'ThreadsPerCore': 2},
+        metadata_options={'HttpPutResponseHopLimit': 1},
+        reload=lambda: None)
+    client = FakeClient()
+    assert reconcile_performance_options(client, instance, options) == ['CpuOptions', 'EbsOptimized']
+    assert client.operations() == ['modify_instance_metadata_options']
+    instance.state = {'Name': 'stopped'}
+    client = FakeClient()
+    assert not reconcile_performance_options(client, instance, options)
+    assert client.operations() == [
+        'modify_instance_metadata_options', 'modify_instance_cpu_options', 'modify_instance_attribute']
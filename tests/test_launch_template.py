@@ -0,0 +1,84 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+import asyncio
+
+from aws_fakes import FakeClient, fake_connection
+
+from carthage_aws.launch_template import AwsLaunchTemplate, launch_template_for, _template_name
+
+class FakeTemplate:
+
+    '''Finds or creates an :class:`AwsLaunchTemplate` against a :class:`FakeClient`.'''
+
+    resource_factory_method = NotImplemented
+
+    find_from_id = AwsLaunchTemplate.find_from_id
+    possible_ids_for_name = AwsLaunchTemplate.possible_ids_for_name
+    do_create = AwsLaunchTemplate.do_create
+    delete = AwsLaunchTemplate.delete
+    hydrate_created = AwsLaunchTemplate.hydrate_created
+
+    def __init__(self, connection, template_data, name, **_kwargs):
+        self.connection = connection
+        self.template_data = template_data
+        self.name = name
+        self.id = None
+        self.mob = None
+
+    def resource_tags(self):
+        return []
+
+    async def find_or_create(self):
+        for resource_id in await self.possible_ids_for_name():
+            self.id = resource_id
+            if self.find_from_id():
+                return
+        self.do_create()
+
+class FakeAinjector:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def get_instance_async(self, _key):
+        return self.connection
+
+    async def __call__(self, cls, **kwargs):
+        assert cls is AwsLaunchTemplate
+        template = FakeTemplate(self.connection, **kwargs)
+        await template.find_or_create()
+        return template
+
+def test_launch_template_find_create_delete():
+    created = []
+    def create_launch_template(LaunchTemplateName, **_kwargs):
+        created.append(LaunchTemplateName)
+        return {'LaunchTemplate': {'LaunchTemplateId': f'lt-{len(created)}', 'DefaultVersionNumber': 1}}
+    # Describe never catches up with the creates
+    client = FakeClient(create_launch_template=create_launch_template,
+                        describe_launch_templates={'LaunchTemplates': []})
+    connection = fake_connection(client)
+    ainjector = FakeAinjector(connection)
+    data = {'ImageId': 'ami-1'}
+    name = _template_name('test', data)
+
+    async def lookup():
+        return await asyncio.gather(launch_template_for(ainjector, data), launch_template_for(ainjector, data))
+    first, second = asyncio.run(lookup())
+    # Found or created once however many VMs share the data
+    assert first is second and first.id == 'lt-1' and created == [name]
+    assert first.find_from_id()['LaunchTemplateId'] == 'lt-1'
+
+    asyncio.run(first.delete())
+    assert client.kwargs('delete_launch_template') == [{'LaunchTemplateId': 'lt-1'}]
+    assert name not in connection.launch_templates
+    assert connection.recently_created_data('lt-1') is None
+    assert first.find_from_id() is None
+    # A deleted template is created again rather than reused
+    assert asyncio.run(launch_template_for(ainjector, data)).id == 'lt-2'
@@ -0,0 +1,103 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from carthage.dependency_injection import InjectionKey
+
+from aws_fakes import FakeClient, fake_connection
+
+from carthage_aws.network import AwsNatGateway, VpcAddress, provision_nat_gateways, destroy_nat_gateways
+
+class FakeGateway:
+
+    '''Records the order in which provisioning touches a gateway in one availability zone.'''
+
+    def __init__(self, zone, events, connectivity_type='public', fail=False):
+        self.zone = zone
+        self.events = events
+        self.connectivity_type = connectivity_type
+        self.fail = fail
+        self.injector = {InjectionKey(VpcAddress)} if connectivity_type == 'public' else set()
+        self.ainjector = SimpleNamespace(get_instance_async=self.allocate_address)
+
+    async def allocate_address(self, key):
+        assert key is VpcAddress
+        self.events.append(('address', self.zone))
+
+    async def async_become_ready(self):
+        self.events.append(('start', self.zone))
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError(self.zone)
+        self.events.append(('available', self.zone))
+
+    async def delete(self):
+        self.events.append(('delete', self.zone))
+        await asyncio.sleep(0.01)
+        self.events.append(('deleted', self.zone))
+
+def test_provision_per_zone():
+    events = []
+    zones = ['us-east-1a', 'us-east-1b', 'us-east-1c']
+    gateways = [FakeGateway(z, events) for z in zones]
+    gateways.append(FakeGateway('us-east-1d', events, connectivity_type='private'))
+    assert asyncio.run(provision_nat_gateways(gateways, ainjector=None)) == gateways
+    # Every address is allocated before any gateway is created, and
+    # all gateways are created before any becomes available.
+    kinds = [kind for kind, _ in events]
+    assert kinds == ['address']*3 + ['start']*4 + ['available']*4
+    assert {z for kind, z in events if kind == 'address'} == set(zones)
+
+def test_provision_failure_waits_for_other_zones():
+    events = []
+    gateways = [FakeGateway('us-east-1a', events, fail=True), FakeGateway('us-east-1b', events)]
+    with pytest.raises(RuntimeError):
+        asyncio.run(provision_nat_gateways(gateways, ainjector=None))
+    assert ('available', 'us-east-1b') in events
+
+def test_destroy_concurrently():
+    events = []
+    gateways = [FakeGateway(z, events) for z in ('us-east-1a', 'us-east-1b')]
+    asyncio.run(destroy_nat_gateways(gateways, ainjector=None))
+    assert [kind for kind, _ in events] == ['delete', 'delete', 'deleted', 'deleted']
+
+def fake_gateway_for_delete(events, public_address=None):
+    gw = SimpleNamespace(id='nat-1', mob=None, connectivity_type='public')
+    def delete_nat_gateway(NatGatewayId):
+        events.append(('delete_nat_gateway', NatGatewayId))
+        gw.mob = {'State': 'deleted'}
+    async def find():
+        gw.mob = {'State': 'available'}
+    async def delete_address():
+        events.append(('delete_address', 'eipalloc-1'))
+    async def pre_create_hook():
+        pass
+    gw.connection = fake_connection(FakeClient(delete_nat_gateway=delete_nat_gateway))
+    gw.connection.remember_created('nat-1', {'NatGatewayId': 'nat-1'})
+    gw.find = find
+    gw.pre_create_hook = pre_create_hook
+    gw.link = SimpleNamespace(
+        merged_v4_config=SimpleNamespace(public_address=public_address),
+        vpc_address=SimpleNamespace(mob={'AllocationId': 'eipalloc-1'}, delete=delete_address))
+    return gw
+
+def test_delete_releases_address_after_gateway():
+    events = []
+    gw = fake_gateway_for_delete(events)
+    asyncio.run(AwsNatGateway.delete(gw))
+    assert events == [('delete_nat_gateway', 'nat-1'), ('delete_address', 'eipalloc-1')]
+    assert gw.connection.recently_created_data('nat-1') is None
+
+def test_delete_keeps_modeled_address():
+    events = []
+    asyncio.run(AwsNatGateway.delete(fake_gateway_for_delete(events, public_address='192.0.2.1')))
+    assert events == [('delete_nat_gateway', 'nat-1')]
@@ -0,0 +1,63 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from carthage_aws.placement import AwsCapacityReservation, AwsPlacementGroup, capacity_reservation_specifications
+
+class FakeReservation(AwsCapacityReservation):
+
+    '''A modeled reservation in *zone* that is described only once made ready.'''
+
+    def __init__(self, reservation_id, zone): # pylint: disable=super-init-not-called
+        self.id = reservation_id
+        self.zone = zone
+        self.mob = None
+
+    async def async_become_ready(self, *_args, **_kwargs):
+        self.mob = {'AvailabilityZone': self.zone}
+        return self
+
+def specifications(items, zones=()):
+    return asyncio.run(capacity_reservation_specifications(items, zones))
+
+def test_capacity_reservation_specifications():
+    group = 'arn:aws:resource-groups:us-east-1:123456789012:group/reserved'
+    assert specifications(['cr-1234', group, 'open'], {'us-east-1a'}) == [
+        {'CapacityReservationTarget': {'CapacityReservationId': 'cr-1234'}},
+        {'CapacityReservationTarget': {'CapacityReservationResourceGroupArn': group}},
+        {'CapacityReservationPreference': 'open'},
+    ]
+    assert not specifications([])
+
+def test_modeled_reservation_specifications():
+    # Reservations are made ready before their zone is checked
+    reservations = [FakeReservation('cr-a', 'us-east-1a'), FakeReservation('cr-b', 'us-east-1b')]
+    assert specifications(reservations, {'us-east-1b'}) == [
+        {'CapacityReservationTarget': {'CapacityReservationId': 'cr-b'}}]
+    with pytest.raises(ValueError):
+        specifications(reservations[:1], {'us-east-1b'})
+
+def placement_group(strategy, partition_count=None, mob=None):
+    return SimpleNamespace(id='pg-1', strategy=strategy, partition_count=partition_count, mob=mob)
+
+def test_placement():
+    assert AwsPlacementGroup.placement(placement_group('cluster')) == {'GroupId': 'pg-1'}
+    assert AwsPlacementGroup.placement(placement_group('partition', 3), 3) == {'GroupId': 'pg-1', 'PartitionNumber': 3}
+    with pytest.raises(ValueError):
+        AwsPlacementGroup.placement(placement_group('spread'), 1)
+    with pytest.raises(ValueError):
+        AwsPlacementGroup.placement(placement_group('partition', 3), 4)
+    with pytest.raises(ValueError):
+        AwsPlacementGroup.placement(placement_group('partition', 3), 0)
+    # An existing group is described by its mob
+    existing = placement_group('cluster', mob={'Strategy': 'partition', 'PartitionCount': 2})
+    assert AwsPlacementGroup.placement(existing, 2)['PartitionNumber'] == 2
@@ -0,0 +1,71 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+# pylint: disable=protected-access
+
+import asyncio
+
+from aws_fakes import FakeClient, fake_connection
+
+from carthage_aws.network import AwsManagedPrefixList
+
+class FakePrefixList:
+
+    '''Reconciles entries with :class:`AwsManagedPrefixList` against a :class:`FakeClient`.'''
+
+    id = 'pl-1'
+    max_entries = None
+    max_entries_per_request = 100
+
+    expected_entries = AwsManagedPrefixList.expected_entries
+    read_write_hook = AwsManagedPrefixList.read_write_hook
+    _modify_entries = AwsManagedPrefixList._modify_entries
+    _entry_list = staticmethod(AwsManagedPrefixList._entry_list)
+
+    def __init__(self, entries, current):
+        self.entries = entries
+        self.current_entries = dict(current)
+        self.mob = {'Version': 1, 'MaxEntries': 10}
+        self.connection = fake_connection(FakeClient(modify_managed_prefix_list=self.modify))
+
+    def modify(self, AddEntries, RemoveEntries, **_kwargs):
+        for entry in RemoveEntries:
+            assert entry['Cidr'] in self.current_entries
+            del self.current_entries[entry['Cidr']]
+        for entry in AddEntries:
+            assert entry['Cidr'] not in self.current_entries
+            self.current_entries[entry['Cidr']] = entry.get('Description', '')
+        return {}
+
+    def find_from_id(self):
+        self.mob = dict(self.mob, Version=self.mob['Version']+1)
+
+    async def wait_for_complete(self):
+        pass
+
+    def modifications(self):
+        return [(kwargs['AddEntries'], kwargs['RemoveEntries'])
+                for kwargs in self.connection.client.kwargs('modify_managed_prefix_list')]
+
+def test_reconcile_adds_and_removes():
+    pl = FakePrefixList(['10.0.0.0/8', ('192.168.0.0/16', 'lab')], {'10.0.0.0/8': '', '172.16.0.0/12': ''})
+    asyncio.run(pl.read_write_hook())
+    assert pl.modifications() == [([{'Cidr': '192.168.0.0/16', 'Description': 'lab'}], [{'Cidr': '172.16.0.0/12'}])]
+    assert pl.current_entries == pl.expected_entries()
+
+def test_reconcile_description_change():
+    pl = FakePrefixList([('10.0.0.0/8', 'new')], {'10.0.0.0/8': 'old'})
+    asyncio.run(pl.read_write_hook())
+    # The CIDR is removed before it is added back with its new description
+    assert pl.modifications() == [([], [{'Cidr': '10.0.0.0/8'}]),
+                                  ([{'Cidr': '10.0.0.0/8', 'Description': 'new'}], [])]
+    assert pl.current_entries == {'10.0.0.0/8': 'new'}
+
+def test_reconcile_unchanged():
+    pl = FakePrefixList([('10.0.0.0/8', 'same')], {'10.0.0.0/8': 'same'})
+    asyncio.run(pl.read_write_hook())
+    assert pl.modifications() == []
@@ -0,0 +1,32 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+from ipaddress import IPv4Network
+
+from carthage_aws import SgRule
+from carthage_aws.network import compile_sg_rules, sg_atoms_from_permissions
+
+def test_compile_collapses_cidrs():
+    rules = [
+        SgRule(cidr=['10.0.0.0/25', '10.0.0.128/25'], port=22),
+        SgRule(cidr='10.0.0.64/26', port=22),
+        SgRule(cidr='10.0.1.0/24', port=22, description='partner'),
+        ]
+    compiled = compile_sg_rules(rules)
+    assert compiled.atoms == {
+        ('tcp', (22, 22), '', IPv4Network('10.0.0.0/24')),
+        ('tcp', (22, 22), 'partner', IPv4Network('10.0.1.0/24')),
+        }
+    assert compile_sg_rules(reversed(rules)) is compiled
+    assert len(compiled.ip_permissions) == 1
+    assert len(compiled.ip_permissions[0]['IpRanges']) == 2
+
+def test_compiled_rules_match_ec2_permissions():
+    compiled = compile_sg_rules([SgRule(cidr='0.0.0.0/0', proto=-1, port=22)])
+    permissions = [{'IpProtocol': '-1', 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}]
+    assert sg_atoms_from_permissions(permissions) == compiled.atoms
@@ -0,0 +1,350 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+# pylint: disable=protected-access
+
+import asyncio
+import gzip
+import os
+from types import SimpleNamespace
+
+import pytest
+from botocore.exceptions import ClientError
+
+from aws_fakes import FakeClient, client_error, fake_connection
+from carthage_aws.launch_template import _content_hash, _template_name
+from carthage_aws.vm import AwsVm, compress_user_data, launch_coalesced, launch_group_tag, user_data_limit
+from carthage_aws.vm import _claim_warm_spare
+
+def run_instances(**kwargs):
+    return {'Instances': [
+        {'InstanceId': f'i-{n}', 'State': {'Name': 'pending'}} for n in range(kwargs['MaxCount'])]}
+
+def stop_instances(InstanceIds, **_kwargs):
+    if 'i-bad' in InstanceIds:
+        raise client_error('IncorrectInstanceState', 'StopInstances')
+    return {'StoppingInstances': [
+        {'InstanceId': i, 'CurrentState': {'Name': 'stopping'}} for i in InstanceIds]}
+
+class InstanceStates:
+
+    '''
+    describe_instances and describe_instance_status responses.  Each
+    instance advances through its list of *states* (or *statuses*) on
+    each describe, then stays in the last.  Instances without states,
+    or whose current state is None, do not exist.
+    '''
+
+    def __init__(self, states, statuses=None):
+        self.states = states
+        self.statuses = statuses or {}
+
+    @staticmethod
+    def advance(states):
+        return states.pop(0) if len(states) > 1 else states[0]
+
+    def describe_instances(self, Filters):
+        states = {i: self.advance(self.states[i]) for i in Filters[0]['Values'] if self.states.get(i)}
+        instances = [
+            {'InstanceId': i, 'State': {'Name': state}, 'NetworkInterfaces': []}
+            for i, state in states.items() if state is not None]
+        return {'Reservations': [{'Instances': instances}]}
+
+    def describe_instance_status(self, InstanceIds, IncludeAllInstances):
+        assert IncludeAllInstances
+        return {'InstanceStatuses': [
+            {'InstanceId': i, 'InstanceStatus': {'Status': self.advance(self.statuses[i])}} for i in InstanceIds]}
+
+def instance_connection(states=None, statuses=None, **responses):
+    states = InstanceStates(states or {}, statuses)
+    responses = {
+        'describe_instances': states.describe_instances,
+        'describe_instance_status': states.describe_instance_status,
+        'run_instances': run_instances,
+        'stop_instances': stop_instances,
+        **responses,
+    }
+    return fake_connection(FakeClient(**responses))
+
+def launch_parameters(name):
+    return {
+        'ImageId': 'ami-1',
+        'TagSpecifications': [{'ResourceType': 'instance', 'Tags': [
+            {'Key': 'Name', 'Value': name}, {'Key': 'carthage:layout', 'Value': 'test'}]}],
+    }
+
+def test_launch_coalesced():
+    connection = instance_connection()
+    async def launch():
+        return await asyncio.gather(*(
+            launch_coalesced(connection, name, launch_parameters(name), window=0.01)
+            for name in ('a', 'b', 'c')))
+    assert asyncio.run(launch()) == ['i-0', 'i-1', 'i-2']
+    client = connection.client
+    assert client.operations() == ['run_instances', 'create_tags', 'create_tags', 'create_tags', 'delete_tags']
+    run = client.kwargs('run_instances')[0]
+    assert run['MinCount'] == run['MaxCount'] == 3
+    assert 'ClientToken' in run
+    tags = run['TagSpecifications'][0]['Tags']
+    assert 'Name' not in {t['Key'] for t in tags}
+    assert launch_group_tag in {t['Key'] for t in tags}
+    assert client.kwargs('create_tags') == [
+        {'Resources': [f'i-{n}'], 'Tags': [{'Key': 'Name', 'Value': name}]}
+        for n, name in enumerate('abc')]
+    assert client.kwargs('delete_tags') == [{'Resources': ['i-0', 'i-1', 'i-2'], 'Tags': [{'Key': launch_group_tag}]}]
+    assert all(connection.recently_created_data(f'i-{n}') for n in range(3))
+
+def fake_vm(compression=None):
+    return SimpleNamespace(
+        name='vm', connection=fake_connection(),
+        _gfi=lambda key, default=None: compression if key == 'aws_user_data_compression' else default)
+
+def test_compress_user_data():
+    connection = fake_connection()
+    document = '#cloud-config\npackages: [nginx]\n'
+    payload = compress_user_data(connection, document)
+    assert gzip.decompress(payload).decode('utf-8') == document
+    # Deterministic and cached, so identical launches coalesce
+    assert compress_user_data(connection, document.encode('utf-8')) is payload
+    assert compress_user_data(fake_connection(), document) == payload
+
+def test_encode_user_data_defaults():
+    document = '#cloud-config\n' + 'runcmd: [true]\n'*100
+    vm = fake_vm()
+    assert gzip.decompress(AwsVm.encode_user_data(vm, document, is_cloud_init=True)).decode('utf-8') == document
+    assert vm.user_data_size < len(document)
+    assert AwsVm.encode_user_data(vm, document) == document
+    assert vm.user_data_size == len(document)
+    assert AwsVm.encode_user_data(fake_vm(compression=False), document, is_cloud_init=True) == document
+    assert gzip.decompress(AwsVm.encode_user_data(fake_vm(compression=True), document)).decode('utf-8') == document
+
+def test_encode_user_data_limit():
+    vm = fake_vm()
+    assert AwsVm.encode_user_data(vm, 'x'*user_data_limit) == 'x'*user_data_limit
+    assert vm.user_data_size == user_data_limit == 16384
+    with pytest.raises(ValueError):
+        AwsVm.encode_user_data(vm, 'x'*(user_data_limit+1))
+    # Compression is applied before the limit is checked
+    assert AwsVm.encode_user_data(vm, 'x'*(2*user_data_limit), is_cloud_init=True)
+    incompressible = os.urandom(2*user_data_limit)
+    with pytest.raises(ValueError):
+        AwsVm.encode_user_data(vm, incompressible, is_cloud_init=True)
+
+class FakeVm:
+
+    describe_instance = AwsVm.describe_instance
+    change_instance_state = AwsVm.change_instance_state
+    wait_for_instance_state = AwsVm.wait_for_instance_state
+    _find_ip_address = AwsVm._find_ip_address
+    _wait_until_running = AwsVm._wait_until_running
+    ip_address = None
+    mob = None
+    network_links = {}
+
+    def __init__(self, connection, instance_id):
+        self.connection = connection
+        self.id = instance_id
+        self.hydrated = None
+
+    def _hydrate(self, instance):
+        self.hydrated = instance
+
+def test_change_instance_state():
+    connection = instance_connection()
+    vms = [FakeVm(connection, i) for i in ('i-1', 'i-2', 'i-bad')]
+    async def stop():
+        return await asyncio.gather(
+            *(vm.change_instance_state('stop_instances') for vm in vms), return_exceptions=True)
+    first, second, bad = asyncio.run(stop())
+    assert first == second == 'stopping'
+    assert isinstance(bad, ClientError)
+    # The batch failed because of one instance and was retried individually
+    assert connection.client.kwargs('stop_instances') == [
+        {'InstanceIds': ['i-1', 'i-2', 'i-bad']},
+        {'InstanceIds': ['i-1']}, {'InstanceIds': ['i-2']}, {'InstanceIds': ['i-bad']}]
+
+@pytest.mark.usefixtures('fast_sleep')
+def test_wait_for_instance_state():
+    connection = instance_connection({'i-1': ['stopping', 'stopping', 'stopped'], 'i-2': ['stopped']})
+    vms = [FakeVm(connection, 'i-1'), FakeVm(connection, 'i-2')]
+    async def wait():
+        return await asyncio.gather(*(vm.wait_for_instance_state('stopped') for vm in vms))
+    assert [i['State']['Name'] for i in asyncio.run(wait())] == ['stopped', 'stopped']
+    assert vms[0].hydrated['InstanceId'] == 'i-1'
+    # Both polled in one call
+    assert connection.client.kwargs('describe_instances')[0]['Filters'][0]['Values'] == ['i-1', 'i-2']
+
+@pytest.mark.usefixtures('fast_sleep')
+def test_wait_for_instance_state_failures():
+    connection = instance_connection({'i-1': ['shutting-down', 'terminated'], 'i-2': ['stopping']})
+    with pytest.raises(RuntimeError):
+        asyncio.run(FakeVm(connection, 'i-1').wait_for_instance_state('running'))
+    with pytest.raises(TimeoutError):
+        asyncio.run(FakeVm(connection, 'i-2').wait_for_instance_state('stopped', timeout=10))
+    # Terminated instances may disappear entirely
+    assert asyncio.run(FakeVm(connection, 'i-gone').wait_for_instance_state('terminated')) is None
+
+@pytest.mark.usefixtures('fast_sleep')
+def test_find_ip_address_requires_running():
+    connection = instance_connection({'i-1': ['pending', 'pending', 'stopping']})
+    with pytest.raises(RuntimeError):
+        asyncio.run(FakeVm(connection, 'i-1')._find_ip_address())
+
+@pytest.mark.usefixtures('fast_sleep')
+def test_find_ip_address_waits_for_instance():
+    # A just-launched instance is not visible at first
+    connection = instance_connection({'i-1': [None, None, 'pending', 'running']})
+    vm = FakeVm(connection, 'i-1')
+    asyncio.run(vm._find_ip_address())
+    assert vm.hydrated['State']['Name'] == 'running'
+    assert len(connection.client.kwargs('describe_instances')) == 4
+    with pytest.raises(RuntimeError):
+        asyncio.run(FakeVm(connection, 'i-gone')._find_ip_address(timeout=10))
+
+class FakeWarmPoolVm(FakeVm):
+
+    replenish_warm_pool = AwsVm.replenish_warm_pool
+    wait_for_status_ok = AwsVm.wait_for_status_ok
+    warm_spare_name = AwsVm.warm_spare_name
+    owned_resource_ids = AwsVm.owned_resource_ids
+    warm_pool_tag = AwsVm.warm_pool_tag
+    warm_pool_config_tag = AwsVm.warm_pool_config_tag
+    name = 'vm'
+
+    def _gfi(self, key, default=None):
+        return {'aws_warm_pool_size': 2, 'aws_hibernate': True}.get(key, default)
+
+@pytest.mark.usefixtures('fast_sleep')
+@pytest.mark.parametrize('hibernation', [True, False])
+def test_replenish_warm_pool(hibernation):
+    def launch_spares(**kwargs):
+        r = run_instances(**kwargs)
+        for i in r['Instances']:
+            i['HibernationOptions'] = {'Configured': hibernation}
+        return r
+    connection = instance_connection(
+        statuses={'i-0': ['initializing', 'ok'], 'i-1': ['ok']},
+        run_instances=launch_spares)
+    vm = FakeWarmPoolVm(connection, None)
+    asyncio.run(vm.replenish_warm_pool(launch_parameters('vm')))
+    client = connection.client
+    run = client.kwargs('run_instances')[0]
+    assert run['ClientToken'] and run['MaxCount'] == 2
+    assert {'Key': 'Name', 'Value': 'vm warm spare'} in run['TagSpecifications'][0]['Tags']
+    assert {'Key': AwsVm.warm_pool_tag, 'Value': 'vm'} in run['TagSpecifications'][0]['Tags']
+    assert {'Key': AwsVm.warm_pool_config_tag, 'Value': _content_hash(launch_parameters('vm'))} \
+        in run['TagSpecifications'][0]['Tags']
+    assert [kwargs['InstanceIds'] for kwargs in client.kwargs('describe_instance_status')] == [['i-0', 'i-1'], ['i-0']]
+    assert client.kwargs('stop_instances') == [
+        {'InstanceIds': ['i-0', 'i-1'], **({'Hibernate': True} if hibernation else {})}]
+    # Spares in the inventory belong to the VM rather than being orphans
+    connection.names_by_resource_type['instance'] = {'vm warm spare': {'i-0', 'i-1'}}
+    assert sorted(vm.owned_resource_ids()) == ['i-0', 'i-1']
+
+class FakeLaunchVm(FakeVm):
+
+    do_create = AwsVm.do_create
+    create_idempotently = AwsVm.create_idempotently
+    client_token = AwsVm.client_token
+    resource_type = 'instance'
+    name = 'vm'
+
+    def __init__(self, connection, capacity_reservations):
+        super().__init__(connection, None)
+        self.capacity_reservations = capacity_reservations
+        self.config_layout = connection.config_layout
+        self.model = SimpleNamespace(name=self.name)
+
+    def launch_parameters(self):
+        return launch_parameters(self.name)
+
+    def hydrate_created(self, resource_id, _data):
+        self.id = resource_id
+
+def reservation(reservation_id):
+    return {'CapacityReservationTarget': {'CapacityReservationId': reservation_id}}
+
+def capacity_connection(errors):
+    # run_instances fails with errors[reservation id] for those reservations
+    def launch(**kwargs):
+        target = kwargs['CapacityReservationSpecification'].get('CapacityReservationTarget', {})
+        if error := errors.get(target.get('CapacityReservationId')):
+            raise client_error(error, 'RunInstances')
+        return run_instances(**kwargs)
+    return instance_connection(run_instances=launch)
+
+def launched_reservations(connection):
+    return [kwargs['CapacityReservationSpecification'] for kwargs in connection.client.kwargs('run_instances')]
+
+def test_do_create_capacity_fallback():
+    connection = capacity_connection(
+        {'cr-full': 'InsufficientInstanceCapacity', 'cr-over': 'ReservationCapacityExceeded'})
+    candidates = [reservation('cr-full'), reservation('cr-over'), {'CapacityReservationPreference': 'open'}]
+    vm = FakeLaunchVm(connection, candidates)
+    assert vm.do_create() is True
+    assert vm.id == 'i-0'
+    assert launched_reservations(connection) == candidates
+    # Other errors, and running out of candidates, are not retried
+    connection = capacity_connection({'cr-full': 'InsufficientInstanceCapacity', 'cr-bad': 'InvalidParameterValue'})
+    vm = FakeLaunchVm(connection, [reservation('cr-bad'), reservation('cr-ok')])
+    assert vm.do_create() is False
+    assert launched_reservations(connection) == [reservation('cr-bad')]
+    vm = FakeLaunchVm(connection, [reservation('cr-full')])
+    assert vm.do_create() is False and vm.id is None
+
+def spare(instance_id, state, config):
+    return {'InstanceId': instance_id, 'State': {'Name': state}, 'Tags': [
+        {'Key': AwsVm.warm_pool_tag, 'Value': 'vm'}, {'Key': AwsVm.warm_pool_config_tag, 'Value': config}]}
+
+@pytest.mark.usefixtures('fast_sleep')
+def test_claim_matching_warm_spare():
+    config = _content_hash(launch_parameters('vm'))
+    spares = [spare('i-old', 'stopped', 'other'), spare('i-match', 'stopped', config),
+              spare('i-booting', 'running', config)]
+    def describe_spares(Filters):
+        assert Filters[0] == {'Name': f'tag:{AwsVm.warm_pool_tag}', 'Values': ['vm']}
+        return {'Reservations': [{'Instances': list(spares)}]}
+    connection = instance_connection(statuses={'i-0': ['ok']}, describe_instances=describe_spares)
+    client = connection.client
+    # Spares launched with other parameters, or not yet stopped, are not claimed
+    claim = (connection, 'vm', AwsVm.warm_pool_tag, AwsVm.warm_pool_config_tag)
+    assert _claim_warm_spare(*claim, config) == 'i-match'
+    assert client.kwargs('delete_tags') == [{
+        'Resources': ['i-match'], 'Tags': [{'Key': AwsVm.warm_pool_tag}, {'Key': AwsVm.warm_pool_config_tag}]}]
+    assert client.kwargs('create_tags') == [{'Resources': ['i-match'], 'Tags': [{'Key': 'Name', 'Value': 'vm'}]}]
+    spares.pop(1)
+    assert _claim_warm_spare(*claim, config) is None
+    # Replenishing terminates the outdated spare and launches one to
+    # join the spare still booting
+    asyncio.run(FakeWarmPoolVm(connection, None).replenish_warm_pool(launch_parameters('vm')))
+    assert client.kwargs('terminate_instances') == [{'InstanceIds': ['i-old']}]
+    assert client.kwargs('run_instances')[0]['MaxCount'] == 1
+
+def test_launch_template_owned():
+    vm = FakeWarmPoolVm(fake_connection(), 'i-1')
+    vm.mob = SimpleNamespace(tags=[
+        {'Key': 'Name', 'Value': 'vm'},
+        {'Key': 'aws:ec2launchtemplate:id', 'Value': 'lt-1'}])
+    assert vm.owned_resource_ids() == ['lt-1']
+    # Templates are per layout
+    data = {'ImageId': 'ami-1'}
+    assert _template_name('layout_1', data) != _template_name('layout_2', data)
+    assert _template_name('layout_1', data).startswith('carthage-')
+
+def test_recently_created(monkeypatch):
+    connection = fake_connection()
+    now = [1000.0]
+    monkeypatch.setattr('carthage_aws.connection.time.monotonic', lambda: now[0])
+    connection.remember_created('i-1', {'InstanceId': 'i-1'})
+    assert connection.recently_created_data('i-1') == {'InstanceId': 'i-1'}
+    # Expired entries are pruned when another is added
+    now[0] += connection.consistency_window+1
+    connection.remember_created('i-2', {'InstanceId': 'i-2'})
+    assert list(connection._recently_created) == ['i-2']
+    connection.forget_created('i-2')
+    assert connection.recently_created_data('i-2') is None